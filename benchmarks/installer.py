@@ -0,0 +1,106 @@
+"""
+Install time of the dependencies of a dev image, by installer.
+
+Mirrors the install step of the dev image Dockerfile (see ``--installer`` of
+``minidocker.py build``) in fresh virtual environments on the host:
+
+- "pip": ``pip install <requirements>``, resolving them;
+- "uv": ``uv pip install --require-hashes --no-deps -r <lock>``, from the lock
+  that ``build`` makes with ``uv pip compile``; the time to make the lock,
+  which is paid only when the dependencies change, is reported separately.
+
+Package caches are warm after the first round, as the BuildKit cache mounts
+are in repeated builds. Run from the root of a repo with a ``pyproject.toml``
+and ``uv`` on ``PATH``, e.g.
+
+    python benchmarks/installer.py --repeat 3
+
+The result is printed as JSON.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import support
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+
+def timed(args):
+    t0 = time.perf_counter()
+    subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from minidocker.py._lock import compile_lock, deps_hash
+    from minidocker.py._util import get_requirements, parse_pyproject
+
+    reqs = get_requirements(parse_pyproject())
+    z = {"pip": [], "uv": [], "lock": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        lock = os.path.join(tmp, "requirements.lock")
+        for k in range(args.repeat + 1):
+            t = {}
+            t0 = time.perf_counter()
+            compile_lock(lock, deps_hash())
+            t["lock"] = time.perf_counter() - t0
+            for installer in ("pip", "uv"):
+                venv = os.path.join(tmp, "{}-{}".format(installer, k))
+                subprocess.run(
+                    [sys.executable, "-m", "venv", "--without-pip", venv]
+                    if installer == "uv"
+                    else [sys.executable, "-m", "venv", venv],
+                    check=True,
+                )
+                python = os.path.join(venv, "bin", "python")
+                if installer == "pip":
+                    seconds = timed([python, "-m", "pip", "install", "-q", *reqs])
+                else:
+                    seconds = timed(
+                        [
+                            "uv",
+                            "pip",
+                            "install",
+                            "-q",
+                            "--python",
+                            python,
+                            "--require-hashes",
+                            "--no-deps",
+                            "-r",
+                            lock,
+                        ]
+                    )
+                t[installer] = seconds
+            print(
+                "round {}: lock {:.2f}s, pip {:.2f}s, uv {:.2f}s".format(
+                    k, t["lock"], t["pip"], t["uv"]
+                ),
+                file=sys.stderr,
+            )
+            if k:
+                # The first round warms the caches.
+                for name, seconds in t.items():
+                    z[name].append(seconds)
+    result = {
+        "python": sys.version.split()[0],
+        "requirements": reqs,
+        "seconds": {k: support.summarize(v) for k, v in z.items()},
+    }
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
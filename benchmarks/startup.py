@@ -0,0 +1,79 @@
+"""
+Startup latency of the ``minidocker.py`` CLIs.
+
+Measures, in fresh interpreters,
+
+- the time to import the ``build`` and ``run`` modules, and
+- the time from launching ``python -m minidocker.py run <image>`` until the first
+  ``docker`` command is started, using the fake ``docker`` in ``fakebin/``.
+
+Run from the root of a git repo that has a ``pyproject.toml``, e.g.
+
+    python benchmarks/startup.py --repeat 20 > startup.json
+
+The result is printed as JSON.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import support
+
+
+def time_import(module, repeat):
+    code = "import time; t0 = time.perf_counter(); import {}; print(time.perf_counter() - t0)".format(
+        module
+    )
+    z = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        z.append(float(out))
+    return support.summarize(z)
+
+
+def time_first_docker_call(image, repeat):
+    z = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, **support.fake_env(tmp, {}))
+        log = os.path.join(tmp, "calls.log")
+        for _ in range(repeat):
+            if os.path.exists(log):
+                os.remove(log)
+            t0 = time.time()
+            subprocess.run(
+                [sys.executable, "-m", "minidocker.py", "run", image, "true"],
+                env=env,
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+            )
+            with open(log) as file:
+                z.append(float(file.readline().split()[0]) - t0)
+    return support.summarize(z)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--image", default="python:3.12-slim")
+    args = parser.parse_args()
+    result = {
+        "python": sys.version.split()[0],
+        "import": {
+            m: time_import(m, args.repeat)
+            for m in ("minidocker.py._run", "minidocker.py._build_for_pkg")
+        },
+        "first_docker_call": time_first_docker_call(args.image, args.repeat),
+    }
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
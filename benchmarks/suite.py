@@ -0,0 +1,215 @@
+"""
+Benchmarks of minidocker's orchestration hot paths.
+
+A fake ``docker``, ``git`` and ``curl`` (see ``fakebin/``) are put first on ``PATH``
+and a local stub stands in for the registry, so what is measured is minidocker's own
+overhead plus that of the fake processes it starts, with no daemon or network.
+Each result has timing statistics in seconds and, per call, the number of
+fake-binary invocations ("subprocesses") and of registry requests.
+
+    python benchmarks/suite.py --output before.json
+    # ... change the code ...
+    python benchmarks/suite.py --compare before.json
+
+Run from the root of the minidocker repo, or with minidocker importable.
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import support
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+
+def bench_lookups(add, registry, *, repeat):
+    from minidocker._find_image import find_image, find_remote_image
+    from minidocker._tag_cache import tag_cache
+
+    tag_cache.enabled = False
+    add(
+        "find_remote_image[tags={}]".format(registry.ntags),
+        lambda: find_remote_image("zppz/py3", registry_url=registry.url),
+        repeat,
+    )
+    add(
+        "find_remote_image[tags={},exact]".format(registry.ntags),
+        lambda: find_remote_image("zppz/py3:000001", registry_url=registry.url),
+        repeat,
+    )
+    tag_cache.enabled = True
+    tag_cache.clear()
+    add(
+        "find_remote_image[tags={},cached]".format(registry.ntags),
+        lambda: find_remote_image("zppz/py3", registry_url=registry.url),
+        repeat,
+    )
+    # Expired at once, so each lookup revalidates the listing.
+    ttl, tag_cache.ttl = tag_cache.ttl, 0
+    add(
+        "find_remote_image[tags={},revalidated]".format(registry.ntags),
+        lambda: find_remote_image("zppz/py3", registry_url=registry.url),
+        repeat,
+    )
+    tag_cache.ttl = ttl
+    tag_cache.enabled = False
+    add(
+        "find_image[tags={},untagged]".format(registry.ntags),
+        lambda: find_image("zppz/py3", registry_url=registry.url, local_backend="cli"),
+        repeat,
+    )
+    add(
+        "find_image[tags={},tagged,local]".format(registry.ntags),
+        lambda: find_image(
+            "zppz/py3:24.01.01", registry_url=registry.url, local_backend="cli"
+        ),
+        repeat,
+    )
+
+
+def bench_run(add, *, repeat):
+    from minidocker.py import _run
+
+    argv = [
+        "-e",
+        "NVIDIA_VISIBLE_DEVICES=0",
+        "-p",
+        "8080:80",
+        "python:3.12",
+        "python",
+        "-c",
+        "pass",
+    ]
+    add("_run.parse_args", lambda: _run.parse_args(list(argv)), repeat * 100)
+    add("_run.main[image]", lambda: _run.main(list(argv)), repeat)
+    add("_run.main[dev]", lambda: _run.main(["benchpkg", "pytest"]), repeat)
+
+
+def bench_build(add, *, repeat):
+    from minidocker.py import _build_for_pkg
+
+    argv = ["--parent", "python:3.12"]
+    add("build[up to date]", lambda: _build_for_pkg.build(argv), repeat)
+    add("build[--force]", lambda: _build_for_pkg.build(argv + ["--force"]), repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--tags",
+        type=int,
+        nargs="+",
+        default=[10, 1000],
+        help="sizes of the remote tag lists to benchmark",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=100,
+        help="most tags per page the stub returns, whatever the client asks for",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per registry stub response"
+    )
+    parser.add_argument("--output", help="write the JSON result here, not stdout")
+    parser.add_argument("--compare", help="JSON result of an earlier run to compare")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="with --compare, exit with 1 if a median grows by more than this factor",
+    )
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="minidocker-bench-")
+    state = os.path.join(tmp, "state")
+    images = {
+        name: support.make_image(name)
+        for name in ("python:3.12", "zppz/py3:24.01.01", "zppz/py3:24.02.01")
+    }
+    os.environ.pop("MINIDOCKER_TRACE", None)
+    os.environ.update(support.fake_env(state, images))
+    os.environ["HOME"] = tmp
+    repo = support.make_repo(os.path.join(tmp, "work", "src", "benchpkg"))
+    os.chdir(repo)
+
+    import minidocker
+
+    results = {}
+
+    def add(name, func, repeat, registry=None):
+        calls = support.count_calls(state)
+        requests = registry.requests if registry else 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            z = support.measure(func, repeat)
+        n = repeat + 1  # including the warm-up call
+        z["subprocesses"] = round((support.count_calls(state) - calls) / n, 2)
+        z["http_requests"] = (
+            round((registry.requests - requests) / n, 2) if registry else 0
+        )
+        results[name] = z
+        print("{:<36} {:>10.6f}".format(name, z["median"]), file=sys.stderr)
+
+    for ntags in args.tags:
+        with support.RegistryStub(
+            ntags=ntags, page_size=args.page_size, latency=args.latency
+        ) as registry:
+            bench_lookups(
+                functools.partial(add, registry=registry), registry, repeat=args.repeat
+            )
+    bench_run(add, repeat=args.repeat)
+    bench_build(add, repeat=args.repeat)
+
+    output = {
+        "minidocker": minidocker.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": args.latency,
+        "page_size": args.page_size,
+        "results": results,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as file:
+            base = json.load(file)["results"]
+        worse = []
+        print(
+            "\n{:<36} {:>10} {:>10} {:>7}".format(
+                "benchmark", "before", "after", "ratio"
+            ),
+            file=sys.stderr,
+        )
+        for name, z in results.items():
+            if name not in base:
+                continue
+            ratio = z["median"] / base[name]["median"]
+            print(
+                "{:<36} {:>10.6f} {:>10.6f} {:>7.2f}".format(
+                    name, base[name]["median"], z["median"], ratio
+                ),
+                file=sys.stderr,
+            )
+            if ratio > args.threshold:
+                worse.append(name)
+        if worse:
+            sys.exit("Slower than before: " + ", ".join(worse))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Shared pieces of the benchmarks: the fake binaries, a registry stub,
+a sample repo, and timing.
+"""
+
+import bisect
+import hashlib
+import http.server
+import json
+import os
+import statistics
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+
+FAKEBIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakebin")
+# Fake `docker`, `git` and `curl`.
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "n": len(values),
+        "min": round(values[0], 6),
+        "median": round(statistics.median(values), 6),
+        "mean": round(statistics.fmean(values), 6),
+        "max": round(values[-1], 6),
+    }
+
+
+def measure(func, repeat, warmup=1):
+    """Call `func` `warmup` + `repeat` times; summarize the durations of the latter."""
+    for _ in range(warmup):
+        func()
+    z = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        z.append(time.perf_counter() - t0)
+    return summarize(z)
+
+
+def fake_env(state_dir, images):
+    """Environment variables that put the fakes first on `PATH`, with `images`
+    (a dict of name to `docker image inspect` record) as the local images,
+    and keep minidocker's cache and the Engine API socket out of the picture."""
+    os.makedirs(state_dir, exist_ok=True)
+    with open(os.path.join(state_dir, "images.json"), "w") as file:
+        json.dump(images, file)
+    return {
+        "PATH": FAKEBIN + os.pathsep + os.environ["PATH"],
+        "MINIDOCKER_FAKE_STATE": state_dir,
+        "MINIDOCKER_CACHE_DIR": os.path.join(state_dir, "cache"),
+        "DOCKER_HOST": "unix://" + os.path.join(state_dir, "no-such.sock"),
+    }
+
+
+def count_calls(state_dir):
+    try:
+        with open(os.path.join(state_dir, "calls.log")) as file:
+            return sum(1 for _ in file)
+    except FileNotFoundError:
+        return 0
+
+
+def make_image(name, labels=None, digest=None):
+    """A `docker image inspect` record; `digest` is the repo digest, as if
+    the image had been pulled."""
+    repo = name.rpartition(":")[0]
+    return {
+        "Id": "sha256:" + hashlib.sha256(name.encode()).hexdigest(),
+        "RepoDigests": ["{}@{}".format(repo, digest)] if digest else [],
+        "Config": {"Labels": labels or {}},
+    }
+
+
+class RegistryStub:
+    """Local server imitating an OCI distribution registry,
+
+        GET      /v2/<repo>/tags/list?n=&last=
+        HEAD/GET /v2/<repo>/manifests/<tag or digest>
+
+    `images` maps repository to a dict of tag to manifest digest; any other
+    repository has `ntags` tags "000000", "000001", ..., the digest of "<repo>:<tag>"
+    being its SHA-256, as the fake `docker pull` records. Tag lists come in pages
+    of the requested `n` tags, at most `page_size`, with `Link` headers to the
+    next page, and an `ETag` that `If-None-Match` is answered with 304.
+    If `auth`, requests without a token get a bearer challenge, answered by
+    `/token`. Each response is delayed by `latency` seconds.
+    Use as a context manager; `url` is the base URL.
+    """
+
+    TOKEN = "stub-token"
+
+    def __init__(self, images=None, *, ntags=0, page_size=100, auth=True, latency=0.0):
+        self.images = images or {}
+        self.ntags = ntags
+        self.page_size = page_size
+        self.auth = auth
+        self.latency = latency
+        self.requests = 0
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            wbufsize = 65536
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.latency)
+                status, headers, body = stub.respond(
+                    self.path,
+                    self.headers.get("Authorization"),
+                    self.headers.get("If-None-Match"),
+                )
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self._server.server_port)
+
+    def tags(self, repo):
+        if repo not in self.images:
+            self.images[repo] = {
+                "{:06d}".format(i): "sha256:"
+                + hashlib.sha256("{}:{:06d}".format(repo, i).encode()).hexdigest()
+                for i in range(self.ntags)
+            }
+        return self.images[repo]
+
+    def respond(self, path, authorization, if_none_match=None):
+        parts = urlsplit(path)
+        if parts.path == "/token":
+            return 200, {}, json.dumps({"token": self.TOKEN}).encode()
+        segments = parts.path.strip("/").split("/")
+        if segments[0] != "v2" or len(segments) < 4:
+            return 404, {}, b"{}"
+        repo = "/".join(segments[1:-2])
+        if self.auth and authorization != "Bearer " + self.TOKEN:
+            challenge = 'Bearer realm="{}/token",service="stub",scope="repository:{}:pull"'.format(
+                self.url, repo
+            )
+            return 401, {"WWW-Authenticate": challenge}, b"{}"
+        tags = self.tags(repo)
+        if not tags:
+            return 404, {}, b"{}"
+        if segments[-2:] == ["tags", "list"]:
+            query = parse_qs(parts.query)
+            n = min(int(query.get("n", [self.page_size])[0]), self.page_size)
+            last = query.get("last", [""])[0]
+            names = sorted(tags)
+            names = names[bisect.bisect_right(names, last) :]
+            headers = {"Content-Type": "application/json"}
+            if len(names) > n:
+                headers["Link"] = '</v2/{}/tags/list?n={}&last={}>; rel="next"'.format(
+                    repo, n, names[n - 1]
+                )
+            body = json.dumps({"name": repo, "tags": names[:n]}).encode()
+            headers["ETag"] = '"{}"'.format(hashlib.sha256(body).hexdigest()[:16])
+            if if_none_match == headers["ETag"]:
+                return 304, headers, b""
+            return 200, headers, body
+        if segments[-2] == "manifests":
+            ref = segments[-1]
+            digest = tags.get(ref) or (ref if ref in tags.values() else None)
+            if digest is None:
+                return 404, {}, b"{}"
+            headers = {
+                "Docker-Content-Digest": digest,
+                "Content-Type": "application/vnd.oci.image.index.v1+json",
+            }
+            return 200, headers, b"{}"
+        return 404, {}, b"{}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def make_repo(path, *, name="benchpkg", branch="main"):
+    """Create a minimal package repo at `path`, as `minidocker.py build` expects:
+    `pyproject.toml`, `src/<pkg>/`, `tests/`, a `.git` directory with HEAD
+    and an origin remote, and a no-op pre-commit hook."""
+    pkg = name.replace("-", "_")
+    files = {
+        "pyproject.toml": (
+            "[project]\n"
+            'name = "{}"\n'
+            'version = "0.1.0"\n'
+            'requires-python = ">=3.8"\n'
+            'dependencies = ["requests", "numpy>=1.24"]\n'
+            "[project.optional-dependencies]\n"
+            'test = ["pytest", "pytest-cov"]\n'.format(name)
+        ),
+        "src/{}/__init__.py".format(pkg): '__version__ = "0.1.0"\n',
+        "tests/test_{}.py".format(pkg): "def test_nothing():\n    pass\n",
+        ".githooks/pre-commit": "exit 0\n",
+        ".git/HEAD": "ref: refs/heads/{}\n".format(branch),
+        ".git/config": '[remote "origin"]\n\turl = https://example.com/x/{}.git\n'.format(
+            name
+        ),
+    }
+    for f, text in files.items():
+        f = os.path.join(path, f)
+        os.makedirs(os.path.dirname(f), exist_ok=True)
+        with open(f, "w") as file:
+            file.write(text)
+    return path
@@ -1,4 +1,6 @@
 import argparse
+import atexit
+import json
 import sys
 
 from ._util import (
@@ -7,11 +9,70 @@ from ._util import (
     get_project_name,
     get_git_branch,
 )
-from ._find_image import find_image, find_local_image, find_remote_image
+from ._find_image import (
+    DEFAULT_TIMEOUT,
+    LOCAL_BACKEND,
+    find_image,
+    find_local_image,
+    find_remote_image,
+    resolve_image,
+)
+from . import _registry
+from ._batch import DEFAULT_JOBS, resolve_batch
+from . import _prefetch
+from ._tag_cache import tag_cache
+from ._trace import TRACE_ENV, tracer
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="seconds allowed for each docker/registry call in image lookups",
+    )
+    parser.add_argument(
+        "--registry-url",
+        default=_registry.DOCKER_HUB_REGISTRY,
+        help="base URL of the registry for Docker Hub images, e.g. a local stub; "
+        "images on other registries use their own host",
+    )
+    parser.add_argument(
+        "--local-backend",
+        choices=["auto", "api", "cli"],
+        default=LOCAL_BACKEND,
+        help="query local images via the Engine API socket, the docker CLI, or either",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="bypass the on-disk cache of remote tag listings",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="empty the cache of remote tag listings before running",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=tag_cache.ttl,
+        help="seconds a cached remote tag lookup is used before it is revalidated "
+        "or looked up again",
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="print tag-cache hit/miss counts to stderr at the end",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="write a Chrome trace of lookups and subprocesses to FILE (env {})".format(
+            TRACE_ENV
+        ),
+    )
     subparsers = parser.add_subparsers(dest="subparser")
     p_find_image = subparsers.add_parser("find-image")
     p_find_image.add_argument("image_name")
@@ -19,31 +80,141 @@ if __name__ == "__main__":
     p_find_local_image.add_argument("local_image_name")
     p_find_remote_image = subparsers.add_parser("find-remote-image")
     p_find_remote_image.add_argument("remote_image_name")
+    p_resolve_image = subparsers.add_parser(
+        "resolve-image",
+        help="like find-image, but compare local and remote digests; print JSON",
+    )
+    p_resolve_image.add_argument("resolve_image_name")
+    p_batch = subparsers.add_parser(
+        "batch",
+        help="resolve many names in parallel, printing one JSON object per line",
+    )
+    p_batch.add_argument(
+        "batch_command", choices=["find-image", "find-local-image", "find-remote-image"]
+    )
+    p_batch.add_argument(
+        "names", nargs="*", help="image names; read from stdin if none or '-'"
+    )
+    p_batch.add_argument("--jobs", type=int, default=DEFAULT_JOBS)
+    p_prefetch = subparsers.add_parser(
+        "prefetch",
+        help="pull newer versions of images in a background process",
+    )
+    p_prefetch.add_argument(
+        "prefetch_names", nargs="+", help="image names; untagged means the latest"
+    )
+    p_prefetch.add_argument("--jobs", type=int, default=_prefetch.DEFAULT_JOBS)
+    p_prefetch.add_argument(
+        "--foreground",
+        action="store_true",
+        help="pull in this process and print one JSON object per image",
+    )
+    p_prefetch_status = subparsers.add_parser(
+        "prefetch-status",
+        help="print the status of background pulls, one JSON object per line",
+    )
+    p_prefetch_status.add_argument(
+        "--clear", action="store_true", help="remove the records of finished pulls"
+    )
     p_make_date_version = subparsers.add_parser("make-date-version")
     p_make_date_version = subparsers.add_parser("make-datetime-version")
     p_get_proj_name = subparsers.add_parser("get-project-name")
     p_get_git_branch = subparsers.add_parser("get-git-branch")
     args = parser.parse_args()
 
+    if args.trace:
+        tracer.start(args.trace)
+    if args.clear_cache:
+        tag_cache.clear()
+    tag_cache.enabled = not args.no_cache
+    tag_cache.ttl = args.cache_ttl
+    if args.cache_stats:
+        atexit.register(
+            lambda: print(
+                "tag cache: "
+                + " ".join("{}={}".format(k, v) for k, v in tag_cache.stats.items()),
+                file=sys.stderr,
+            )
+        )
+
     cmd = args.subparser
     if cmd == "find-image":
-        z = find_image(args.image_name)
+        z = find_image(
+            args.image_name, args.timeout, args.registry_url, args.local_backend
+        )
         if z:
             print(z)
         else:
             sys.exit('Can not find image "%s"' % args.image_name)
     elif cmd == "find-local-image":
-        z = find_local_image(args.local_image_name)
+        z = find_local_image(args.local_image_name, args.timeout, args.local_backend)
         if z:
             print(z)
         else:
             sys.exit('Can not find local image "%s"' % args.local_image_name)
     elif cmd == "find-remote-image":
-        z = find_remote_image(args.remote_image_name)
+        z = find_remote_image(args.remote_image_name, args.timeout, args.registry_url)
         if z:
             print(z)
         else:
             sys.exit('Can not find remote image "%s"' % args.remote_image_name)
+    elif cmd == "resolve-image":
+        z = resolve_image(
+            args.resolve_image_name, args.timeout, args.registry_url, args.local_backend
+        )
+        print(json.dumps(z))
+        if z["image"] is None:
+            sys.exit('Can not find image "%s"' % args.resolve_image_name)
+    elif cmd == "batch":
+        names = args.names
+        if not names or names == ["-"]:
+            names = [line.strip() for line in sys.stdin]
+            names = [v for v in names if v]
+        failed = False
+        for z in resolve_batch(
+            args.batch_command,
+            names,
+            jobs=args.jobs,
+            timeout=args.timeout,
+            registry_url=args.registry_url,
+            local_backend=args.local_backend,
+        ):
+            failed = failed or z["error"] is not None
+            print(json.dumps(z), flush=True)
+        if failed:
+            sys.exit(1)
+    elif cmd == "prefetch":
+        if args.foreground:
+            failed = False
+            for z in _prefetch.prefetch(
+                args.prefetch_names,
+                jobs=args.jobs,
+                timeout=args.timeout,
+                registry_url=args.registry_url,
+                local_backend=args.local_backend,
+            ):
+                failed = failed or z["state"] in ("not found", "failed")
+                print(json.dumps(z), flush=True)
+            if failed:
+                sys.exit(1)
+        else:
+            pid = _prefetch.start_prefetch(
+                args.prefetch_names,
+                jobs=args.jobs,
+                timeout=args.timeout,
+                registry_url=args.registry_url,
+                local_backend=args.local_backend,
+            )
+            print(
+                "Prefetching in process {}; see `python -m minidocker prefetch-status`".format(
+                    pid
+                )
+            )
+    elif cmd == "prefetch-status":
+        if args.clear:
+            _prefetch.clear_status()
+        for z in _prefetch.read_status():
+            print(json.dumps(z))
     elif cmd == "make-date-version":
         print(make_date_version())
     elif cmd == "make-datetime-version":
@@ -52,5 +223,7 @@ if __name__ == "__main__":
         print(get_project_name())
     elif cmd == "get-git-branch":
         print(get_git_branch())
+    elif cmd is None and args.clear_cache:
+        pass
     else:
         sys.exit('Unknown sub-command "%s"' % cmd)
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ._docker_api import get_local_index
+from ._find_image import (
+    DEFAULT_TIMEOUT,
+    find_image,
+    find_local_image,
+    find_remote_image,
+)
+
+
+DEFAULT_JOBS = 8
+
+
+def resolve_batch(
+    command,
+    names,
+    *,
+    jobs=DEFAULT_JOBS,
+    timeout=DEFAULT_TIMEOUT,
+    registry_url=None,
+    local_backend=None,
+):
+    """Resolve many image names concurrently with at most `jobs` workers.
+
+    `command` is one of "find-image", "find-local-image", "find-remote-image".
+    Yields one dict per name, in input order, with keys
+    "name", "result" (`None` if not found), "error" and "seconds".
+
+    All workers share the process-wide local image index and HTTP session,
+    so the docker listing and the registry connections are set up once.
+    """
+    if command == "find-image":
+
+        def resolve(name):
+            return find_image(name, timeout, registry_url, local_backend)
+    elif command == "find-local-image":
+
+        def resolve(name):
+            return find_local_image(name, timeout, local_backend)
+    elif command == "find-remote-image":
+
+        def resolve(name):
+            return find_remote_image(name, timeout, registry_url)
+    else:
+        raise ValueError("unknown command {!r}".format(command))
+
+    if command != "find-remote-image" and local_backend != "cli":
+        # Fetch the local index before fanning out.
+        get_local_index(timeout)
+
+    def work(name):
+        t0 = time.perf_counter()
+        try:
+            result, error = resolve(name), None
+        except Exception as e:
+            result, error = None, "{}: {}".format(type(e).__name__, e)
+        return {
+            "name": name,
+            "result": result,
+            "error": error,
+            "seconds": round(time.perf_counter() - t0, 6),
+        }
+
+    with ThreadPoolExecutor(max(1, jobs)) as pool:
+        yield from pool.map(work, names)
@@ -0,0 +1,137 @@
+import http.client
+import json
+import os
+import socket
+import threading
+
+from ._trace import span
+
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+
+def get_socket_path():
+    # The Engine API is reachable in-process only via a unix socket;
+    # `None` means the daemon is elsewhere (`tcp://`, `ssh://`) or absent.
+    host = os.environ.get("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        path = host[len("unix://") :]
+    elif host:
+        return None
+    else:
+        path = DEFAULT_SOCKET
+    if not os.path.exists(path):
+        return None
+    return path
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerAPI:
+    """Client of the Docker Engine API over a unix socket.
+
+    One connection is kept open and reused by all requests;
+    requests are serialized.
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        self._conn = UnixHTTPConnection(socket_path, timeout=timeout)
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    with span("GET " + path.split("?")[0], "engine-api") as info:
+                        self._conn.request("GET", path)
+                        resp = self._conn.getresponse()
+                        body = resp.read()
+                        info["status"] = resp.status
+                    break
+                except (http.client.RemoteDisconnected, ConnectionError):
+                    # The daemon closed the idle connection; reconnect once.
+                    self._conn.close()
+                    if attempt:
+                        raise
+        if resp.status != 200:
+            raise http.client.HTTPException(
+                "GET {} returned {}: {}".format(path, resp.status, body[:200])
+            )
+        return json.loads(body)
+
+    def images(self):
+        return self.get("/images/json")
+
+    def close(self):
+        self._conn.close()
+
+
+class ImageIndex:
+    """In-memory index of local images by repository and tag,
+    built from one `/images/json` listing."""
+
+    def __init__(self, images):
+        self._repos = {}
+        for image in images:
+            for repotag in image.get("RepoTags") or []:
+                if repotag == "<none>:<none>":
+                    continue
+                repo, tag = repotag.rsplit(":", 1)
+                self._repos.setdefault(repo, {})[tag] = image
+
+    def tags(self, repo):
+        return list(self._repos.get(repo, ()))
+
+    def get(self, repo, tag):
+        return self._repos.get(repo, {}).get(tag)
+
+
+_api = None
+_index = None
+_lock = threading.Lock()
+
+
+def get_api(timeout=None):
+    """Return the process-wide `DockerAPI`, or `None` if the Engine API
+    is not reachable over a unix socket."""
+    global _api
+    if _api is None:
+        path = get_socket_path()
+        if path is None:
+            return None
+        _api = DockerAPI(path, timeout=timeout)
+    return _api
+
+
+def get_local_index(timeout=None, refresh=False):
+    """Return the `ImageIndex` of the local daemon, fetched once per process,
+    or `None` if the Engine API is not available."""
+    global _index
+    with _lock:
+        if _index is None or refresh:
+            api = get_api(timeout)
+            if api is None:
+                return None
+            try:
+                _index = ImageIndex(api.images())
+            except (OSError, ValueError, http.client.HTTPException):
+                return None
+        return _index
+
+
+def invalidate_local_index():
+    """Make the next `get_local_index` fetch the image list again, e.g. after
+    a build or pull in a long-running process."""
+    global _index
+    with _lock:
+        _index = None
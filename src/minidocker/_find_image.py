@@ -1,8 +1,48 @@
+import http.client
+import json
+import os
 import subprocess
-from ._util import run_command_for_output
 
+from ._docker_api import get_local_index
+from ._registry import NotModified, get_client, parse_reference, remote_digest
+from ._tag_cache import tag_cache
+from ._trace import traced
+from ._util import run_command_for_output, run_in_thread
 
-def find_local_image(name):
+
+DEFAULT_TIMEOUT = 30
+# Seconds allowed for each `docker` call or HTTP request during a lookup.
+
+LOCAL_BACKEND = os.environ.get("MINIDOCKER_LOCAL_BACKEND", "auto")
+# How to query local images:
+#   "api": the Docker Engine API over the unix socket;
+#   "cli": the `docker` command;
+#   "auto": "api" if the socket is reachable, else "cli".
+
+
+def split_tag(name):
+    # Split "repo:tag" into ("repo", "tag"), or ("repo", None) if untagged.
+    # A colon before the last slash belongs to a registry port.
+    repo, sep, tag = name.rpartition(":")
+    if not sep or "/" in tag:
+        return name, None
+    return repo, tag
+
+
+def _find_in_index(index, name):
+    repo, tag = split_tag(name)
+    if tag is not None:
+        return name if index.get(repo, tag) else None
+    tags = index.tags(repo)
+    if not tags:
+        return None
+    if "latest" in tags:
+        return name + ":latest"
+    return name + ":" + max(tags)
+
+
+@traced("lookup")
+def find_local_image(name, timeout=DEFAULT_TIMEOUT, backend=None):
     # Find the latest tag of an image on local disk,
     # assuming tags are sortable.
     # The sole input is the name of the image, with repository as needed,
@@ -10,13 +50,23 @@ def find_local_image(name):
     #     debian
     #     zppz/py3
 
+    backend = backend or LOCAL_BACKEND
+    if backend != "cli":
+        # The image list is fetched once per process and
+        # answers all later queries.
+        index = get_local_index(timeout)
+        if index is not None:
+            return _find_in_index(index, name)
+        if backend == "api":
+            raise ConnectionError("Docker Engine API is not reachable")
+
     if ":" in name:
-        if run_command_for_output(["docker", "images", "-q", name]):
+        if run_command_for_output(["docker", "images", "-q", name], timeout=timeout):
             # Exists locally.
             return name
 
     tags = run_command_for_output(
-        ["docker", "image", "ls", name, "--format", '"{{.Tag}}"']
+        ["docker", "image", "ls", name, "--format", '"{{.Tag}}"'], timeout=timeout
     )
     if not tags:
         return None
@@ -29,40 +79,76 @@ def find_local_image(name):
     return name + ":" + max(tags)
 
 
-def find_remote_image(name):
-    NAME = name
-    if ":" in NAME:
-        tag = NAME.split(":")[-1]
-        name = NAME.rstrip(":" + tag)
-        url = "https://hub.docker.com/v2/repositories/{}/tags/{}/".format(name, tag)
-        if run_command_for_output(["curl", "--silent", "-f", "--head", "-lL", url]):
-            # Exists remotely.
-            return NAME
+def _cache_key(name, registry_url):
+    # The registry is part of the key, so that e.g. a stub and the real
+    # registry do not share entries.
+    url, repo, _ = parse_reference(name, registry_url)
+    return "{}/{}".format(url, repo)
+
 
-    url = "https://hub.docker.com/v2/repositories/{}/tags/".format(NAME)
+def _latest_tag(name, timeout, registry_url):
+    # `name` has no tag.
+    key = _cache_key(name, registry_url)
+    entry = tag_cache.get(key)
+    if entry and "fetched" not in entry:
+        # Only exact tags are known.
+        entry = None
+    if entry and tag_cache.is_fresh(entry["fetched"]):
+        tag_cache.stats["hits"] += 1
+        return entry["latest"]
+    # An expired entry costs one request if the listing has not changed.
+    etag = entry.get("etag") if entry else None
+    url, repo, _ = parse_reference(name, registry_url)
     try:
-        tags = run_command_for_output(["curl", "--silent", "-f", "-lL", url])
-    except subprocess.CalledProcessError:
+        latest, etag = get_client(url, timeout).latest_tag(repo, etag=etag)
+        tag_cache.stats["misses"] += 1
+    except NotModified:
+        tag_cache.stats["revalidated"] += 1
+        latest = entry["latest"]
+    except (OSError, ValueError, http.client.HTTPException):
         return None
+    tag_cache.put_latest(key, latest, etag)
+    return latest
 
-    tags = (
-        tags.replace("{", "")
-        .replace("}", "")
-        .replace("[", "")
-        .replace("]", "")
-        .split(",")
-    )
-    tags = [v for v in tags if '"name"' in v]
-    if tags:
-        tags = [v.replace('"', "").lstrip("name:") for v in tags]
-        return NAME + ":" + max(tags)
+
+@traced("lookup")
+def find_remote_image(name, timeout=DEFAULT_TIMEOUT, registry_url=None):
+    # Find the latest tag of an image in its registry (Docker Hub by default),
+    # or check that a tagged image exists there.
+    # `registry_url` overrides the registry for Docker Hub images.
+    NAME = name
+    name, tag = split_tag(NAME)
+    if tag is not None:
+        key = _cache_key(name, registry_url)
+        if tag_cache.has_tag(key, tag):
+            tag_cache.stats["hits"] += 1
+            return NAME
+        # A manifest HEAD request answers for an exact tag; the listing of all
+        # tags, which may take many pages, is only needed if it does not exist.
+        if remote_digest(NAME, timeout, registry_url):
+            tag_cache.add_tag(key, tag)
+            return NAME
+    latest = _latest_tag(name, timeout, registry_url)
+    if latest:
+        return name + ":" + latest
 
     return None
 
 
-def find_image(name):
-    tag_local = find_local_image(name)
-    tag_remote = find_remote_image(name)
+@traced("lookup")
+def find_image(name, timeout=DEFAULT_TIMEOUT, registry_url=None, local_backend=None):
+    # If `name` carries a tag and the image exists locally, the remote result
+    # is not needed, so the local image list is checked first; else look up
+    # local and remote concurrently.
+    if split_tag(name)[1] is not None:
+        tag_local = find_local_image(name, timeout, local_backend)
+        if tag_local:
+            return tag_local
+        return find_remote_image(name, timeout, registry_url)
+    remote = run_in_thread(find_remote_image, name, timeout, registry_url)
+    tag_local = find_local_image(name, timeout, local_backend)
+    tag_remote = remote.result()
+
     if tag_local:
         if tag_remote and tag_remote > tag_local:
             return tag_remote
@@ -71,3 +157,86 @@ def find_image(name):
         return tag_remote
     else:
         return None
+
+
+def local_digest(name, timeout=DEFAULT_TIMEOUT, backend=None):
+    """The repo digest of local image `name`, i.e. the digest of the registry
+    manifest it was pulled by; `None` if it is not local or was built here."""
+    repo, tag = split_tag(name)
+    digests = None
+    if (backend or LOCAL_BACKEND) != "cli":
+        index = get_local_index(timeout)
+        if index is not None:
+            image = index.get(repo, tag or "latest")
+            if image is None:
+                return None
+            digests = image.get("RepoDigests") or []
+    if digests is None:
+        try:
+            z = run_command_for_output(
+                [
+                    "docker",
+                    "image",
+                    "inspect",
+                    "--format",
+                    "{{json .RepoDigests}}",
+                    name,
+                ],
+                timeout=timeout,
+            )
+        except subprocess.CalledProcessError:
+            return None
+        digests = json.loads(z) or []
+    for d in digests:
+        if d.split("@")[0] == repo:
+            return d.split("@")[1]
+    return digests[0].split("@")[1] if digests else None
+
+
+@traced("lookup")
+def resolve_image(name, timeout=DEFAULT_TIMEOUT, registry_url=None, local_backend=None):
+    """Like `find_image`, but decide between local and remote by content.
+
+    The repo digest of the local image is compared with the digest of the
+    remote manifest (by a HEAD request), so that an image that is merely
+    re-tagged remotely, or a tag that has moved remotely, is recognized.
+    Return a dict with keys
+
+        "image": the chosen "name:tag", or `None` if not found;
+        "digest": its content digest, `None` if unknown (e.g. built locally);
+        "local_digest", "remote_digest": the two digests compared;
+        "pull": whether the image has to be pulled, that is, the remote
+            content differs from the local, or there is no local image.
+    """
+    remote = run_in_thread(find_remote_image, name, timeout, registry_url)
+    tag_local = find_local_image(name, timeout, local_backend)
+    tag_remote = remote.result()
+    z = {
+        "image": tag_local,
+        "digest": None,
+        "local_digest": None,
+        "remote_digest": None,
+        "pull": False,
+    }
+    if tag_local is None and tag_remote is None:
+        return z
+    if tag_remote is not None:
+        # The remote counterpart: the newer tag if any, else the same tag.
+        if tag_local is None or tag_remote > tag_local:
+            candidate = tag_remote
+        else:
+            candidate = tag_local
+        digest = run_in_thread(remote_digest, candidate, timeout, registry_url)
+    if tag_local is not None:
+        z["local_digest"] = local_digest(tag_local, timeout, local_backend)
+    if tag_remote is not None:
+        z["remote_digest"] = digest.result()
+    z["digest"] = z["local_digest"]
+    if tag_remote is None or z["remote_digest"] is None:
+        # Remote unknown; stay with what find_image would pick.
+        if tag_local is None:
+            z["image"], z["pull"] = tag_remote, True
+        return z
+    if z["remote_digest"] != z["local_digest"]:
+        z["image"], z["digest"], z["pull"] = candidate, z["remote_digest"], True
+    return z
@@ -0,0 +1,113 @@
+import http.client
+import json
+import threading
+from urllib.parse import urljoin, urlsplit
+
+from ._trace import span
+
+
+class Response:
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers  # keys in lower case
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class HTTPClient:
+    """A small keep-alive HTTP client.
+
+    Connections are pooled per (scheme, host, port) and reused across
+    requests and threads, so resolving many images in one process pays
+    for the TCP/TLS handshake once per host rather than once per request.
+    """
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, scheme, netloc, timeout):
+        with self._lock:
+            pool = self._pools.setdefault((scheme, netloc), [])
+            if pool:
+                conn = pool.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=timeout), False
+        return http.client.HTTPConnection(netloc, timeout=timeout), False
+
+    def _release(self, scheme, netloc, conn):
+        with self._lock:
+            self._pools.setdefault((scheme, netloc), []).append(conn)
+
+    def _request_once(self, method, url, headers, timeout):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        while True:
+            conn, reused = self._acquire(parts.scheme, parts.netloc, timeout)
+            try:
+                with span(
+                    "{} {}".format(method, parts.netloc), "http", url=url, reused=reused
+                ) as info:
+                    conn.request(method, path, headers=headers)
+                    resp = conn.getresponse()
+                    body = resp.read()
+                    info["status"] = resp.status
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                if reused:
+                    # The server closed an idle keep-alive connection; retry on a new one.
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(parts.scheme, parts.netloc, conn)
+            headers = {k.lower(): v for k, v in resp.getheaders()}
+            return Response(url, resp.status, headers, body)
+
+    def request(self, method, url, headers=None, timeout=None):
+        headers = dict(headers or {})
+        for _ in range(self.MAX_REDIRECTS + 1):
+            resp = self._request_once(method, url, headers, timeout)
+            if resp.status not in (301, 302, 303, 307, 308):
+                return resp
+            location = urljoin(url, resp.headers["location"])
+            if urlsplit(location)[:2] != urlsplit(url)[:2]:
+                # E.g. a registry sends blob downloads to a CDN, which is not
+                # to see the registry's token.
+                headers = {
+                    k: v for k, v in headers.items() if k.lower() != "authorization"
+                }
+            url = location
+        return resp
+
+    def get(self, url, headers=None, timeout=None):
+        return self.request("GET", url, headers, timeout)
+
+    def head(self, url, headers=None, timeout=None):
+        return self.request("HEAD", url, headers, timeout)
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+
+
+session = HTTPClient()
+# Shared by all lookups in this process.
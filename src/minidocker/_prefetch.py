@@ -0,0 +1,285 @@
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from ._find_image import DEFAULT_TIMEOUT, resolve_image, split_tag
+from ._trace import TRACE_ENV, run
+from ._util import get_cache_dir
+
+
+DEFAULT_JOBS = 2
+# Pulls at a time in one prefetch process. Pulls are bound by network and disk,
+# so a few at once is about as fast as many.
+
+PULL_COMMAND = os.environ.get("MINIDOCKER_PULL_COMMAND", "docker pull")
+# Command that pulls an image, with the image name appended as the last argument.
+
+LOCK_GRACE = 10
+# Seconds a lock file may be empty, i.e. being written, before it is taken as stale.
+
+
+def status_dir():
+    """Directory of the prefetch state: per image, "<name>.json" with the status
+    of its latest pull, "<name>.log" with the output of the pull, and
+    "<name>.lock" while a pull is running."""
+    return get_cache_dir("prefetch")
+
+
+def _path(name, suffix):
+    return os.path.join(status_dir(), quote(name, safe="") + suffix)
+
+
+def _alive(pid):
+    if os.name != "posix":
+        return _alive_windows(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user.
+        return True
+    return True
+
+
+def _alive_windows(pid):
+    # `os.kill(pid, 0)` would end the process on Windows; ask for its exit code.
+    import ctypes
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    STILL_ACTIVE = 259
+    ERROR_ACCESS_DENIED = 5
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # Exists, owned by another user; or does not exist.
+        return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+    try:
+        code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+            return True
+        return code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def acquire(name):
+    """Create the lock file of image `name`, holding this process's ID.
+
+    Return `False` if a live process holds the lock, meaning it is pulling
+    the image. A lock left by a process that has died is removed.
+    """
+    path = _path(name, ".lock")
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(path) as file:
+                    pid = int(file.read() or 0)
+                age = time.time() - os.path.getmtime(path)
+            except FileNotFoundError:
+                # Just released.
+                continue
+            except (OSError, ValueError):
+                pid, age = 0, float("inf")
+            if (pid and _alive(pid)) or (not pid and age < LOCK_GRACE):
+                return False
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w") as file:
+            file.write(str(os.getpid()))
+        return True
+    return False
+
+
+def release(name):
+    try:
+        os.remove(_path(name, ".lock"))
+    except FileNotFoundError:
+        pass
+
+
+def _write_status(name, status):
+    path = _path(name, ".json")
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as file:
+        json.dump(status, file)
+    os.replace(tmp, path)
+
+
+def _last_line(path):
+    # Last non-empty line of a pull log, which tells its progress.
+    try:
+        with open(path, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            file.seek(max(0, file.tell() - 4096))
+            lines = file.read().decode(errors="replace").replace("\r", "\n").split("\n")
+    except OSError:
+        return None
+    lines = [v.strip() for v in lines if v.strip()]
+    return lines[-1] if lines else None
+
+
+def read_status():
+    """Status of all pulls recorded in `status_dir`, latest first.
+
+    Each is a dict with keys "image", "requested", "state" ("pulling", "done",
+    "failed", or "interrupted" if the pulling process has died), "digest",
+    "pid", "started", "seconds" (so far, if still pulling), "exit_code",
+    "log", and "progress", the last line of the log.
+    """
+    z = []
+    for f in os.listdir(status_dir()):
+        if not f.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(status_dir(), f)) as file:
+                status = json.load(file)
+        except (OSError, ValueError):
+            # Removed or being replaced.
+            continue
+        if status["state"] == "pulling":
+            if _alive(status["pid"]):
+                status["seconds"] = round(time.time() - status["started"], 3)
+            else:
+                status["state"] = "interrupted"
+        status["progress"] = _last_line(status["log"])
+        z.append(status)
+    z.sort(key=lambda v: v["started"], reverse=True)
+    return z
+
+
+def clear_status():
+    """Remove the records of finished pulls."""
+    for status in read_status():
+        if status["state"] != "pulling":
+            for suffix in (".json", ".log"):
+                try:
+                    os.remove(_path(status["image"], suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def pull(name, log):
+    """Pull image `name` with `PULL_COMMAND`, writing its output to file `log`.
+    Return the exit code."""
+    args = shlex.split(PULL_COMMAND) + [name]
+    with open(log, "w") as file:
+        return run(
+            args, stdin=subprocess.DEVNULL, stdout=file, stderr=subprocess.STDOUT
+        ).returncode
+
+
+def prefetch_one(name, timeout=DEFAULT_TIMEOUT, registry_url=None, local_backend=None):
+    """Pull the image that `resolve_image(name)` picks if it is not the local one,
+    e.g. a newer tag or a moved tag, unless another process is pulling it.
+
+    Return a dict with keys "name", "image", "state" and "seconds". "state" is
+    "not found", "up to date", "in progress" (elsewhere), "done" or "failed".
+    """
+    t0 = time.perf_counter()
+    z = resolve_image(name, timeout, registry_url, local_backend)
+    image = z["image"]
+    if image is None:
+        state = "not found"
+    elif not z["pull"]:
+        state = "up to date"
+    elif not acquire(image):
+        state = "in progress"
+    else:
+        try:
+            status = {
+                "image": image,
+                "requested": name,
+                "state": "pulling",
+                "digest": z["digest"],
+                "pid": os.getpid(),
+                "started": time.time(),
+                "seconds": None,
+                "exit_code": None,
+                "log": _path(image, ".log"),
+            }
+            _write_status(image, status)
+            code = pull(image, status["log"])
+            state = "done" if code == 0 else "failed"
+            status.update(
+                state=state,
+                exit_code=code,
+                seconds=round(time.time() - status["started"], 3),
+            )
+            _write_status(image, status)
+        finally:
+            release(image)
+    return {
+        "name": name,
+        "image": image,
+        "state": state,
+        "seconds": round(time.perf_counter() - t0, 6),
+    }
+
+
+def prefetch(
+    names,
+    *,
+    jobs=DEFAULT_JOBS,
+    timeout=DEFAULT_TIMEOUT,
+    registry_url=None,
+    local_backend=None,
+):
+    """Call `prefetch_one` on each of `names`, at most `jobs` at a time.
+    Yield the results in input order."""
+
+    def work(name):
+        return prefetch_one(name, timeout, registry_url, local_backend)
+
+    with ThreadPoolExecutor(max(1, jobs)) as pool:
+        yield from pool.map(work, dict.fromkeys(names))
+
+
+def start_prefetch(
+    names,
+    *,
+    jobs=DEFAULT_JOBS,
+    timeout=DEFAULT_TIMEOUT,
+    registry_url=None,
+    local_backend=None,
+):
+    """Run `prefetch` of `names` in a detached process, which outlives this one.
+    Return the process ID.
+
+    The output of the process is appended to "worker.log" in `status_dir`;
+    use `read_status` to follow the pulls.
+    """
+    args = [sys.executable, "-m", "minidocker", "--timeout", str(timeout)]
+    if registry_url:
+        args += ["--registry-url", registry_url]
+    if local_backend:
+        args += ["--local-backend", local_backend]
+    args += ["prefetch", "--foreground", "--jobs", str(jobs), *names]
+    env = dict(os.environ)
+    # The trace file belongs to this process.
+    env.pop(TRACE_ENV, None)
+    with open(os.path.join(status_dir(), "worker.log"), "a") as file:
+        proc = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=file,
+            stderr=subprocess.STDOUT,
+            env=env,
+            start_new_session=True,
+        )
+    return proc.pid
+
+
+def repository(name):
+    # "repo:tag" or "repo@sha256:..." -> "repo", whose latest tag is prefetched.
+    return split_tag(name.partition("@")[0])[0]
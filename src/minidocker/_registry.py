@@ -0,0 +1,297 @@
+import base64
+import http.client
+import json
+import os
+import re
+import subprocess
+import threading
+from functools import lru_cache
+from urllib.parse import urlencode, urljoin, urlsplit
+
+from ._http import session
+from ._trace import run
+from ._util import run_in_thread
+
+
+DOCKER_HUB_REGISTRY = os.environ.get(
+    "MINIDOCKER_REGISTRY_URL", "https://registry-1.docker.io"
+)
+# Registry API of Docker Hub; point it at a local stub for testing.
+
+PAGE_SIZE = 1000
+# Tags requested per page of a tag listing.
+
+MANIFEST_TYPES = ", ".join(
+    [
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    ]
+)
+# Accepted for manifest requests. Index/list types come first, so that for a
+# multi-platform image the digest is that of the index, which is what
+# `docker pull` records in `RepoDigests`.
+
+
+def parse_reference(name, hub_registry=None):
+    """Split an image reference into (registry URL, repository, tag or digest).
+
+    "zppz/py3:24.01.01" -> (Docker Hub, "zppz/py3", "24.01.01");
+    "debian" -> (Docker Hub, "library/debian", None);
+    "localhost:5000/x/y@sha256:..." -> ("http://localhost:5000", "x/y", "sha256:...").
+
+    `hub_registry` overrides the registry URL for Docker Hub images.
+    """
+    name, sep, digest = name.partition("@")
+    first, _, rest = name.partition("/")
+    if rest and ("." in first or ":" in first or first == "localhost"):
+        registry, path = first, rest
+    else:
+        registry, path = None, name
+    ref = digest or None
+    repo, sep, tag = path.rpartition(":")
+    if sep and "/" not in tag:
+        path, ref = repo, ref or tag
+    if registry is None:
+        if "/" not in path:
+            path = "library/" + path
+        return (hub_registry or DOCKER_HUB_REGISTRY).rstrip("/"), path, ref
+    scheme = "http" if registry.split(":")[0] in ("localhost", "127.0.0.1") else "https"
+    return "{}://{}".format(scheme, registry), path, ref
+
+
+class NotModified(Exception):
+    """A conditional request found the resource unchanged."""
+
+
+HUB_CONFIG_KEYS = ("https://index.docker.io/v1/", "index.docker.io", "docker.io")
+# Keys under which `docker login` stores the credentials of Docker Hub.
+
+
+def _docker_config():
+    path = os.path.join(
+        os.environ.get("DOCKER_CONFIG") or os.path.expanduser("~/.docker"),
+        "config.json",
+    )
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _credential_helper(helper, server):
+    # -> (username, secret) from `docker-credential-<helper> get`, or `None`.
+    try:
+        z = run(
+            ["docker-credential-" + helper, "get"],
+            input=server,
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if z.returncode:
+        return None
+    try:
+        z = json.loads(z.stdout)
+    except ValueError:
+        return None
+    return z.get("Username"), z.get("Secret")
+
+
+@lru_cache(maxsize=None)
+def docker_credentials(url):
+    """`(username, secret)` that `docker login` stored for the registry at
+    `url`, in `~/.docker/config.json` (or `$DOCKER_CONFIG`) or a credential
+    helper it names; `None` if there are none.
+
+    Identity tokens (username "<token>") are not supported and give `None`.
+    """
+    host = urlsplit(url).netloc
+    if host == "docker.io" or host.endswith(".docker.io"):
+        servers = HUB_CONFIG_KEYS
+    else:
+        servers = (host, "https://" + host, "http://" + host)
+    config = _docker_config()
+    creds = None
+    for server in servers:
+        helper = (config.get("credHelpers") or {}).get(server)
+        if helper:
+            creds = _credential_helper(helper, server)
+            break
+        auth = ((config.get("auths") or {}).get(server) or {}).get("auth")
+        if auth:
+            try:
+                user, _, secret = base64.b64decode(auth).decode().partition(":")
+            except ValueError:
+                continue
+            creds = user, secret
+            break
+    else:
+        if config.get("credsStore"):
+            creds = _credential_helper(config["credsStore"], servers[0])
+    if not creds or not creds[0] or not creds[1] or creds[0] == "<token>":
+        return None
+    return creds
+
+
+_CHALLENGE_RE = re.compile(r'(\w+)="([^"]*)"')
+_LINK_RE = re.compile(r'<([^>]*)>\s*;\s*rel="?next"?')
+
+
+class RegistryClient:
+    """Client of the OCI distribution API of one registry.
+
+    Bearer tokens are obtained as "401 Unauthorized" challenges demand,
+    and cached per scope for the life of the client. The token service gets
+    the registry's credentials from the Docker config, if any (see
+    `docker_credentials`), over HTTPS; else the tokens are anonymous.
+    """
+
+    def __init__(self, url, timeout=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._realm = None  # (realm, service) of the last auth challenge
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def _token(self, realm, service, scope):
+        key = (realm, service, scope)
+        with self._lock:
+            if key in self._tokens:
+                return self._tokens[key]
+        params = {k: v for k, v in (("service", service), ("scope", scope)) if v}
+        headers = {}
+        creds = docker_credentials(self.url)
+        if creds and realm.startswith("https://"):
+            headers["Authorization"] = (
+                "Basic " + base64.b64encode(":".join(creds).encode()).decode()
+            )
+        resp = session.get(
+            realm + "?" + urlencode(params), headers, timeout=self.timeout
+        )
+        if resp.status != 200:
+            return None
+        z = resp.json()
+        token = z.get("token") or z.get("access_token")
+        with self._lock:
+            self._tokens[key] = token
+        return token
+
+    def request(self, method, path, headers=None, repo=None):
+        """Request `path` (starting with "/v2/", or a full URL on the registry)
+        about repository `repo`.
+
+        Once the registry has issued an auth challenge, tokens for other
+        repositories are fetched up front rather than after another 401.
+        """
+        url = urljoin(self.url, path)
+        headers = dict(headers or {})
+        scope = "repository:{}:pull".format(repo) if repo else None
+        if self._realm is not None and scope:
+            token = self._token(*self._realm, scope)
+            if token:
+                headers["Authorization"] = "Bearer " + token
+        resp = session.request(method, url, headers, self.timeout)
+        challenge = resp.headers.get("www-authenticate", "")
+        if resp.status == 401 and challenge.lower().startswith("bearer "):
+            params = dict(_CHALLENGE_RE.findall(challenge))
+            if "realm" in params:
+                self._realm = (params["realm"], params.get("service"))
+                token = self._token(*self._realm, params.get("scope", scope))
+                if token:
+                    headers["Authorization"] = "Bearer " + token
+                    resp = session.request(method, url, headers, self.timeout)
+        return resp
+
+    def manifest_digest(self, repo, ref):
+        """Digest of the manifest of `repo:ref` by a HEAD request,
+        or `None` if it does not exist."""
+        resp = self.request(
+            "HEAD",
+            "/v2/{}/manifests/{}".format(repo, ref),
+            {"Accept": MANIFEST_TYPES},
+            repo,
+        )
+        if resp.status != 200:
+            return None
+        return resp.headers.get("docker-content-digest")
+
+    def tag_pages(self, repo, page_size=PAGE_SIZE, etag=None):
+        """Yield the pages of the tag listing of `repo`, each a pair of the
+        list of tags and the response, following the `Link` headers.
+
+        The next page is requested while the caller works on the current one.
+        With `etag`, the first page is requested with `If-None-Match`, and
+        `NotModified` is raised if it has not changed.
+        Nothing is yielded if the repository does not exist; other errors
+        raise `http.client.HTTPException`.
+        """
+
+        def fetch(path, headers=None):
+            return self.request("GET", path, headers, repo=repo)
+
+        path = "/v2/{}/tags/list?n={}".format(repo, page_size)
+        future = run_in_thread(fetch, path, {"If-None-Match": etag} if etag else None)
+        while future is not None:
+            resp = future.result()
+            if resp.status == 304:
+                raise NotModified(resp.url)
+            if resp.status == 404:
+                return
+            if resp.status != 200:
+                raise http.client.HTTPException(
+                    "GET {} returned {}".format(resp.url, resp.status)
+                )
+            m = _LINK_RE.search(resp.headers.get("link", ""))
+            future = run_in_thread(fetch, urljoin(resp.url, m.group(1))) if m else None
+            yield resp.json().get("tags") or [], resp
+
+    def latest_tag(self, repo, page_size=PAGE_SIZE, etag=None):
+        """Return `(latest, etag)`: the greatest tag of `repo`, assuming tags
+        are sortable, e.g. by date, or `None` if there is none; and the `ETag`
+        of the listing, if it has one and fits in one page. Only one page of
+        tags is held at a time.
+
+        With `etag` from an earlier call, raise `NotModified` if the listing
+        has not changed, at the cost of one request.
+        """
+        latest = None
+        etags = []
+        for tags, resp in self.tag_pages(repo, page_size, etag):
+            etags.append(resp.headers.get("etag"))
+            if tags:
+                top = max(tags)
+                if latest is None or top > latest:
+                    latest = top
+        # The `ETag` of the first of several pages does not cover the others.
+        return latest, etags[0] if len(etags) == 1 else None
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url, timeout=None):
+    """Return the process-wide `RegistryClient` for registry `url`,
+    so that tokens are shared by all lookups."""
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = RegistryClient(url, timeout)
+        client = _clients[url]
+    if timeout is not None:
+        client.timeout = timeout
+    return client
+
+
+def remote_digest(name, timeout=None, registry_url=None):
+    """Digest of the remote manifest of image `name` ("latest" if untagged),
+    or `None` if it is not found or the registry is unreachable."""
+    url, repo, ref = parse_reference(name, registry_url)
+    try:
+        return get_client(url, timeout).manifest_digest(repo, ref or "latest")
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+from ._util import get_cache_dir
+
+
+DEFAULT_TTL = 600
+# Seconds during which a cached tag lookup is used without asking the registry.
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# Total size of the cache directory; least-recently-used entries are evicted beyond this.
+
+
+class TagCache:
+    """On-disk cache of remote tag lookups, one JSON file per repository,
+    keyed by the registry URL and the repository name.
+
+    Each entry records the latest tag of the repository (`None` if it has
+    none) with the time it was fetched and the `ETag` of the tag listing,
+    if any, and the tags known to exist, each with the time it was confirmed.
+    A fact younger than `ttl` is used as is; an older latest tag is
+    revalidated with `If-None-Match` by the caller, and other facts are
+    looked up again.
+
+    Files are written to a temp file and renamed into place, so parallel
+    jobs sharing the directory never see a partial entry. Reading an entry
+    bumps its mtime, which drives the LRU eviction.
+    """
+
+    def __init__(self, directory=None, *, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self._directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = True
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            self._directory = get_cache_dir("tags")
+        return self._directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, quote(key, safe="") + ".json")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if entry.get("key") != key:
+            # Written by an older version.
+            return None
+        return entry
+
+    def is_fresh(self, t):
+        # `t` is the time a fact in an entry was fetched.
+        return t is not None and time.time() - t < self.ttl
+
+    def has_tag(self, key, tag):
+        """Whether `tag` of `key` is known, and recently, to exist."""
+        entry = self.get(key)
+        return bool(entry) and self.is_fresh(entry["tags"].get(tag))
+
+    def put_latest(self, key, latest, etag=None):
+        self._update(key, latest=latest, etag=etag, tags=[latest] if latest else [])
+
+    def add_tag(self, key, tag):
+        self._update(key, tags=[tag])
+
+    def _update(self, key, tags, **fields):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self.get(key) or {"key": key, "latest": None, "tags": {}}
+            if "latest" in fields:
+                entry.update(fields)
+                entry["fetched"] = now
+            for tag in tags:
+                entry["tags"][tag] = now
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as file:
+                    json.dump(entry, file)
+                os.replace(tmp, self._path(key))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                # Removed by a parallel job.
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._directory = None
+
+
+tag_cache = TagCache()
@@ -0,0 +1,269 @@
+import atexit
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+TRACE_ENV = "MINIDOCKER_TRACE"
+# If set, the path of the trace file to write at exit.
+
+
+class Tracer:
+    """Records spans of phases and subprocesses in Chrome trace format.
+
+    The file written by `finish` can be opened in https://ui.perfetto.dev
+    or `chrome://tracing`. Nothing is recorded until `start` is called.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.events = []
+        self._t0 = time.perf_counter()
+        self._pid = os.getpid()
+        self._tids = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def start(self, path):
+        if self.path is None:
+            atexit.register(self.finish)
+        self.path = path
+
+    def _tid(self):
+        ident = threading.get_ident()
+        with self._lock:
+            if ident not in self._tids:
+                self._tids[ident] = len(self._tids)
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": self._pid,
+                        "tid": self._tids[ident],
+                        "args": {"name": threading.current_thread().name},
+                    }
+                )
+            return self._tids[ident]
+
+    def add(self, name, cat, t0, t1, tid=None, **args):
+        # `t0` and `t1` are `time.perf_counter()` values.
+        if not self.enabled:
+            return
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round((t0 - self._t0) * 1e6, 1),
+            "dur": round((t1 - t0) * 1e6, 1),
+            "pid": self._pid,
+            "tid": self._tid() if tid is None else tid,
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, cat="phase", **args):
+        """Record the duration of the `with` block. The yielded dict is
+        included in the span's "args", so that results can be added to it."""
+        if not self.enabled:
+            yield args
+            return
+        t0 = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            self.add(name, cat, t0, time.perf_counter(), **args)
+
+    def summary(self):
+        totals = {}
+        for e in self.events:
+            if e["ph"] != "X":
+                continue
+            z = totals.setdefault((e["cat"], e["name"]), [0, 0.0, 0.0, None])
+            z[0] += 1
+            z[1] += e["dur"] / 1e6
+            z[2] = max(z[2], e["dur"] / 1e6)
+            rss = e["args"].get("peak_rss")
+            if rss is not None:
+                z[3] = max(z[3] or 0, rss)
+        if not totals:
+            return ""
+        rows = sorted(totals.items(), key=lambda kv: -kv[1][1])
+        width = max(len(name) for (_, name), _ in rows)
+        lines = [
+            "{:<10}  {:<{}}  {:>5}  {:>9}  {:>9}  {:>8}".format(
+                "kind", "name", width, "count", "total s", "max s", "peak MB"
+            )
+        ]
+        for (cat, name), (count, total, longest, rss) in rows:
+            lines.append(
+                "{:<10}  {:<{}}  {:>5}  {:>9.2f}  {:>9.2f}  {:>8}".format(
+                    cat,
+                    name,
+                    width,
+                    count,
+                    total,
+                    longest,
+                    "" if rss is None else "{:.1f}".format(rss / 2**20),
+                )
+            )
+        return "\n".join(lines)
+
+    def finish(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            events = list(self.events)
+        with open(self.path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        z = self.summary()
+        if z:
+            print("\nTrace written to {}\n{}".format(self.path, z), file=sys.stderr)
+
+
+tracer = Tracer()
+if os.environ.get(TRACE_ENV):
+    tracer.start(os.environ[TRACE_ENV])
+
+
+def span(name, cat="phase", **args):
+    return tracer.span(name, cat, **args)
+
+
+def traced(cat="phase"):
+    """Decorator that records a span for each call of the function,
+    with its string arguments."""
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with span(func.__name__, cat, args=[a for a in args if isinstance(a, str)]):
+                return func(*args, **kwargs)
+
+        return wrapped
+
+    return decorate
+
+
+def _span_name(args):
+    # E.g. "docker build", "git ls-files": the program and its first non-option
+    # argument, which is informative enough to group spans by.
+    if isinstance(args, (str, bytes)):
+        args = [args]
+    args = [os.fsdecode(a) for a in args]
+    name = os.path.basename(args[0])
+    for a in args[1:]:
+        if not a.startswith("-"):
+            return "{} {}".format(name, a[:40])
+    return name
+
+
+class Popen(subprocess.Popen):
+    """`subprocess.Popen` that, while tracing is enabled, records a span
+    from start to exit with the argv, exit code and peak RSS of the child.
+
+    The RSS is that of the direct child (e.g. the `docker` client), obtained
+    by `os.wait4`; it is not available on platforms without it.
+    """
+
+    def __init__(self, args, *a, **kw):
+        self._trace_t0 = time.perf_counter() if tracer.enabled else None
+        self._trace_tid = tracer._tid() if tracer.enabled else None
+        self.peak_rss = None
+        super().__init__(args, *a, **kw)
+
+    def wait(self, timeout=None):
+        if (
+            self._trace_t0 is not None
+            and self.returncode is None
+            and hasattr(os, "wait4")
+        ):
+            self._wait4(timeout)
+        retcode = super().wait(timeout)
+        if self._trace_t0 is not None:
+            t0, self._trace_t0 = self._trace_t0, None
+            tracer.add(
+                _span_name(self.args),
+                "subprocess",
+                t0,
+                time.perf_counter(),
+                tid=self._trace_tid,
+                argv=[os.fsdecode(a) for a in self.args]
+                if not isinstance(self.args, (str, bytes))
+                else os.fsdecode(self.args),
+                exit_code=retcode,
+                peak_rss=self.peak_rss,
+            )
+        return retcode
+
+    def _wait4(self, timeout):
+        # Reap the child with `os.wait4`, which also gives its resource usage,
+        # under the lock that `subprocess` takes around its own waits, so that
+        # a `poll` or `communicate` in another thread does not reap it too.
+        # With a timeout, poll like `subprocess` does.
+        endtime = None if timeout is None else time.monotonic() + timeout
+        delay = 0.0005
+        while self.returncode is None:
+            if self._waitpid_lock.acquire(endtime is None):
+                try:
+                    if self.returncode is not None:
+                        break
+                    pid, status, usage = os.wait4(
+                        self.pid, 0 if endtime is None else os.WNOHANG
+                    )
+                    if pid:
+                        self.returncode = (
+                            -os.WTERMSIG(status)
+                            if os.WIFSIGNALED(status)
+                            else os.WEXITSTATUS(status)
+                        )
+                        # `ru_maxrss` is in kilobytes on Linux, bytes on macOS.
+                        self.peak_rss = usage.ru_maxrss * (
+                            1 if sys.platform == "darwin" else 1024
+                        )
+                        break
+                except ChildProcessError:
+                    # Reaped elsewhere; `subprocess` takes it from here.
+                    break
+                finally:
+                    self._waitpid_lock.release()
+            remaining = endtime - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+
+def run(args, *, input=None, capture_output=False, timeout=None, check=False, **kwargs):
+    """Same as `subprocess.run`, but the process is traced (see `Popen`)."""
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    with Popen(args, **kwargs) as proc:
+        try:
+            stdout, stderr = proc.communicate(input, timeout=timeout)
+        except BaseException:
+            proc.kill()
+            raise
+        retcode = proc.poll()
+    if check and retcode:
+        raise subprocess.CalledProcessError(
+            retcode, proc.args, output=stdout, stderr=stderr
+        )
+    return subprocess.CompletedProcess(proc.args, retcode, stdout, stderr)
@@ -1,19 +1,89 @@
 import configparser
+import getpass
+import glob
+import os
+import platform
+import socket
 import subprocess
+import threading
 import warnings
 from datetime import datetime, timezone
+from functools import cached_property
+
+from ._trace import Popen, run
 
 
 def run_command(args, **kwargs):
-    subprocess.run(args, check=True, **kwargs)
+    run(args, check=True, **kwargs)
+
+
+def run_command_streaming_input(args, write, **kwargs):
+    """Like `run_command`, but the command's stdin is a pipe that `write`
+    is called with, so that large input need not be held in memory."""
+    proc = Popen(args, stdin=subprocess.PIPE, **kwargs)
+    try:
+        write(proc.stdin)
+        proc.stdin.close()
+    except BrokenPipeError:
+        # The command exited early; its return code tells why.
+        pass
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    retcode = proc.wait()
+    if retcode:
+        raise subprocess.CalledProcessError(retcode, args)
 
 
-def run_command_for_output(args):
-    return subprocess.run(
-        args, check=True, capture_output=True, text=True
+def run_command_for_output(args, timeout=None):
+    return run(
+        args, check=True, capture_output=True, text=True, timeout=timeout
     ).stdout.rstrip("\n")
 
 
+def get_cache_dir(*parts):
+    """Return (and create) a directory under minidocker's cache root.
+
+    The root is `$MINIDOCKER_CACHE_DIR` if set, else `$XDG_CACHE_HOME/minidocker`,
+    else `~/.cache/minidocker`.
+    """
+    root = os.environ.get("MINIDOCKER_CACHE_DIR")
+    if not root:
+        root = os.path.join(
+            os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"),
+            "minidocker",
+        )
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def run_in_thread(func, *args, **kwargs):
+    """Call `func` in a daemon thread and return a `Future` for its result.
+
+    Unlike `ThreadPoolExecutor`, an abandoned call does not hold up
+    the caller's return or the interpreter's exit.
+    """
+    # Imported here; `concurrent.futures` is slow to import and most commands
+    # do not need it.
+    from concurrent.futures import Future
+
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+
 def make_date_version(sep="."):
     """Generate a version string in the format 25.08.12 in UTC date.
 
@@ -30,11 +100,83 @@ def make_datetime_version(sep="-"):
     return datetime.now(timezone.utc).strftime("%Y%m%d{}%H%M%S".format(sep))
 
 
+class RepoContext:
+    """Facts about the git repo whose root directory is `root`.
+
+    Each is read from the files under `.git` on first access and then memoized;
+    no `git` process is started. Worktrees and submodules, where `.git` is a file
+    pointing to the actual git directory, are supported.
+    """
+
+    def __init__(self, root="."):
+        self.root = os.path.abspath(root)
+
+    @cached_property
+    def git_dir(self):
+        path = os.path.join(self.root, ".git")
+        if os.path.isfile(path):
+            # A worktree or submodule: the file reads "gitdir: <path>".
+            with open(path) as file:
+                z = file.read().strip()
+            assert z.startswith("gitdir:"), z
+            path = os.path.join(self.root, z[len("gitdir:") :].strip())
+        return os.path.normpath(path)
+
+    @cached_property
+    def common_dir(self):
+        # The git directory shared by all worktrees, where `config` lives.
+        try:
+            with open(os.path.join(self.git_dir, "commondir")) as file:
+                z = file.read().strip()
+        except FileNotFoundError:
+            return self.git_dir
+        return os.path.normpath(os.path.join(self.git_dir, z))
+
+    @cached_property
+    def branch(self):
+        # Like `git branch --show-current`, empty if HEAD is detached.
+        with open(os.path.join(self.git_dir, "HEAD")) as file:
+            head = file.read().strip()
+        prefix = "ref: refs/heads/"
+        return head[len(prefix) :] if head.startswith(prefix) else ""
+
+    @cached_property
+    def config(self):
+        config = configparser.ConfigParser(strict=False)
+        config.read(os.path.join(self.common_dir, "config"))
+        return config
+
+    @cached_property
+    def project_name(self):
+        url = self.config['remote "origin"']["url"]
+        pkg = url.rstrip("/").split("/")[-1]
+        if pkg.endswith(".git"):
+            pkg = pkg[: -len(".git")]
+        if "_" in pkg:
+            warnings.warn(
+                "project name, '{}', contains understore; it is recommended to use dash instead".format(
+                    pkg
+                )
+            )
+        return pkg
+
+
+_repos = {}
+
+
+def get_repo(root="."):
+    """Return the memoized `RepoContext` for `root`."""
+    root = os.path.abspath(root)
+    if root not in _repos:
+        _repos[root] = RepoContext(root)
+    return _repos[root]
+
+
 def get_git_branch():
     """
     This assumes the current working directory is the root directory of the repo.
     """
-    return run_command_for_output(["git", "branch", "--show-current"])
+    return get_repo().branch
 
 
 def get_project_name():
@@ -49,14 +191,75 @@ def get_project_name():
 
     This could be different from the "project name" in `pyproject.toml`.
     """
-    config = configparser.ConfigParser()
-    config.read(".git/config")
-    url = config['remote "origin"']["url"]
-    pkg = url.split("/")[-1].rstrip(".git")
-    if "_" in pkg:
-        warnings.warn(
-            "project name, '{}', contains understore; it is recommended to use dash instead".format(
-                pkg
-            )
-        )
-    return pkg
+    return get_repo().project_name
+
+
+class HostContext:
+    """Facts about the host machine, computed on first access and memoized."""
+
+    @cached_property
+    def user(self):
+        return getpass.getuser()
+
+    @cached_property
+    def os(self):
+        return platform.system()
+
+    @cached_property
+    def ip(self):
+        # `$HOST_IP` if set; else the address of the interface that carries
+        # outbound traffic, found by "connecting" a UDP socket, which sends
+        # no packet and needs no DNS lookup.
+        ip = os.environ.get("HOST_IP")
+        if ip:
+            return ip
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect(("10.255.255.255", 1))
+                return sock.getsockname()[0]
+        except OSError:
+            return "127.0.0.1"
+
+    @cached_property
+    def memory(self):
+        # Bytes of physical memory; `None` if unknown, e.g. on Windows.
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (AttributeError, ValueError, OSError):
+            return None
+
+    @cached_property
+    def numa_nodes(self):
+        # NUMA node number -> its CPUs in the notation of `--cpuset-cpus`,
+        # e.g. "0-15,32-47". Empty if unknown; one node if not NUMA.
+        z = {}
+        for path in glob.glob("/sys/devices/system/node/node[0-9]*/cpulist"):
+            node = int(os.path.basename(os.path.dirname(path))[len("node") :])
+            with open(path) as file:
+                cpus = file.read().strip()
+            if cpus:
+                # Nodes with memory but no CPUs have an empty list.
+                z[node] = cpus
+        return dict(sorted(z.items()))
+
+    @cached_property
+    def timezone(self):
+        # IANA name of the local time zone, e.g. "America/Los_Angeles";
+        # `None` if unknown.
+        tz = os.environ.get("TZ", "").lstrip(":")
+        if "/" in tz and not tz.startswith("/"):
+            return tz
+        try:
+            with open("/etc/timezone") as file:
+                return file.read().strip() or None
+        except OSError:
+            pass
+        try:
+            link = os.readlink("/etc/localtime")
+        except OSError:
+            return None
+        _, sep, tz = link.partition("zoneinfo/")
+        return tz if sep else None
+
+
+host = HostContext()
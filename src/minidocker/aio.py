@@ -0,0 +1,335 @@
+"""
+Asyncio API for driving many image lookups, builds and containers from one process.
+
+Each coroutine runs its command with `asyncio.create_subprocess_exec`, at most
+`max_jobs()` at a time per event loop, and returns a `Result` rather than
+raising or printing, e.g.
+
+    import asyncio
+    from minidocker import aio
+
+    async def main():
+        parents = await asyncio.gather(*(aio.find_image(n) for n in names))
+        builds = await asyncio.gather(
+            *(aio.build(tag, context=d, timeout=600) for tag, d in targets)
+        )
+        for r in builds:
+            if not r.ok:
+                print(r.args, r.returncode, r.stderr[-2000:])
+
+Cancelling a call, or exceeding its `timeout`, kills the command;
+for `run`, the container is removed as well.
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import tempfile
+import time
+import uuid
+import weakref
+
+from ._docker_api import invalidate_local_index
+from ._find_image import DEFAULT_TIMEOUT
+from ._find_image import find_image as _find_image
+from ._trace import _span_name, tracer
+
+
+MAX_JOBS = int(os.environ.get("MINIDOCKER_AIO_JOBS", "8"))
+# Default number of commands run at the same time per event loop.
+
+IMAGE_COMMANDS = {"build", "pull", "tag", "rmi", "rm", "prune", "load", "import"}
+# `docker` or `docker image` subcommands that change the local images, after
+# which the local image index used by `find_image` is fetched again.
+
+_semaphores = weakref.WeakKeyDictionary()
+# Event loop -> semaphore; a semaphore belongs to one loop.
+
+
+class Result:
+    """Outcome of a command: `args`, `returncode` (`None` if it timed out),
+    `stdout` and `stderr` as text (empty if not captured), `seconds` from
+    start to exit, and `value`, the parsed result of the call, if any."""
+
+    def __init__(self, args, returncode, stdout, stderr, seconds, value=None):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.seconds = seconds
+        self.value = value
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def timed_out(self):
+        return self.returncode is None
+
+    def check(self):
+        """Raise `subprocess.TimeoutExpired` or `subprocess.CalledProcessError`
+        if the command did not succeed; else return `self`."""
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(
+                self.args, self.seconds, output=self.stdout, stderr=self.stderr
+            )
+        if self.returncode:
+            raise subprocess.CalledProcessError(
+                self.returncode, self.args, output=self.stdout, stderr=self.stderr
+            )
+        return self
+
+    def __repr__(self):
+        return "Result(args={!r}, returncode={!r}, seconds={:.3f}, value={!r})".format(
+            self.args, self.returncode, self.seconds, self.value
+        )
+
+
+def max_jobs():
+    return MAX_JOBS
+
+
+def set_max_jobs(n):
+    """Set the number of concurrent commands, for event loops that have
+    not started one yet."""
+    global MAX_JOBS
+    MAX_JOBS = max(1, int(n))
+
+
+def _semaphore():
+    loop = asyncio.get_running_loop()
+    sem = _semaphores.get(loop)
+    if sem is None:
+        sem = _semaphores[loop] = asyncio.Semaphore(MAX_JOBS)
+    return sem
+
+
+def _changes_images(args):
+    if os.path.basename(args[0]) != "docker" or len(args) < 2:
+        return False
+    if args[1] == "image":
+        return len(args) > 2 and args[2] in IMAGE_COMMANDS
+    # `docker rm` and `docker prune` are about containers.
+    return args[1] in IMAGE_COMMANDS - {"rm", "prune"} or args[1] == "commit"
+
+
+def _read_iid(path):
+    try:
+        with open(path) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _text(data):
+    return data.decode(errors="replace") if data else ""
+
+
+async def run_command(
+    args, *, input=None, timeout=None, capture_output=True, check=False, **kwargs
+):
+    """Run `args`, waiting for a free slot first, and return a `Result`.
+
+    `input` is text or bytes for stdin. With `timeout` seconds (counted from
+    the start of the command) exceeded, the command is killed and the result
+    has `returncode` `None`. If `check`, a failure raises (see `Result.check`).
+    Other keyword arguments, e.g. `env` and `cwd`, go to
+    `asyncio.create_subprocess_exec`.
+    """
+    args = [os.fsdecode(a) for a in args]
+    if isinstance(input, str):
+        input = input.encode()
+    pipe = subprocess.PIPE if capture_output else None
+    async with _semaphore():
+        t0 = time.perf_counter()
+        # In its own process group, so that a kill reaches its children too,
+        # which would otherwise hold the output pipes open.
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+            stdout=pipe,
+            stderr=pipe,
+            start_new_session=os.name == "posix",
+            **kwargs,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout)
+            returncode = proc.returncode
+        except asyncio.TimeoutError:
+            stdout = stderr = None
+            returncode = None
+        finally:
+            if proc.returncode is None:
+                # Timed out or cancelled.
+                try:
+                    if os.name == "posix":
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    else:
+                        # No process groups; only the command itself is killed.
+                        proc.kill()
+                except ProcessLookupError:
+                    pass
+                await asyncio.shield(proc.wait())
+        t1 = time.perf_counter()
+    tracer.add(
+        _span_name(args),
+        "subprocess",
+        t0,
+        t1,
+        argv=args,
+        exit_code=returncode,
+        timed_out=returncode is None,
+    )
+    if _changes_images(args):
+        invalidate_local_index()
+    result = Result(args, returncode, _text(stdout), _text(stderr), t1 - t0)
+    if check:
+        result.check()
+    return result
+
+
+async def find_image(
+    name, timeout=DEFAULT_TIMEOUT, registry_url=None, local_backend=None
+):
+    """Look up the latest local or remote tag of `name` like `find_image` of
+    the CLI. `value` is the "name:tag" found, or `None`, in which case
+    `returncode` is 1; an error in the lookup gives `returncode` 2 and the
+    error in `stderr`.
+
+    The lookup is made in a thread, using the process-wide local image index
+    and HTTP connections; `timeout` applies to each of its requests.
+    """
+    args = ["find-image", name]
+    loop = asyncio.get_running_loop()
+    async with _semaphore():
+        t0 = time.perf_counter()
+        with tracer.span("find_image", "lookup", args=[name]):
+            try:
+                value = await loop.run_in_executor(
+                    None, _find_image, name, timeout, registry_url, local_backend
+                )
+            except Exception as e:
+                return Result(
+                    args,
+                    2,
+                    "",
+                    "{}: {}".format(type(e).__name__, e),
+                    time.perf_counter() - t0,
+                )
+    return Result(
+        args,
+        0 if value else 1,
+        value or "",
+        "",
+        time.perf_counter() - t0,
+        value=value,
+    )
+
+
+async def build(
+    tag,
+    *,
+    context=".",
+    dockerfile=None,
+    build_args=None,
+    labels=None,
+    options=(),
+    timeout=None,
+    check=False,
+    env=None,
+):
+    """`docker build -t tag context`. `dockerfile` is the text of the
+    Dockerfile, if not the one in `context`; `build_args` and `labels`
+    are dicts; `options` are any other `docker build` options.
+    `value` is the ID of the image built."""
+    args = ["docker", "build", "-t", tag]
+    for k, v in (build_args or {}).items():
+        args.extend(["--build-arg", "{}={}".format(k, v)])
+    for k, v in (labels or {}).items():
+        args.extend(["--label", "{}={}".format(k, v)])
+    with tempfile.TemporaryDirectory() as tmp:
+        iidfile = os.path.join(tmp, "iid")
+        args.extend(["--iidfile", iidfile, *options])
+        if dockerfile is not None:
+            args.extend(["-f", "-"])
+        args.append(context)
+        result = await run_command(
+            args,
+            input=dockerfile,
+            timeout=timeout,
+            check=check,
+            env={**os.environ, "DOCKER_BUILDKIT": "1", **(env or {})},
+        )
+        result.value = await asyncio.get_running_loop().run_in_executor(
+            None, _read_iid, iidfile
+        )
+    return result
+
+
+async def run(
+    image,
+    command=(),
+    *,
+    options=(),
+    remove=True,
+    detach=False,
+    timeout=None,
+    check=False,
+    input=None,
+):
+    """`docker run [--rm] [--detach] options image command`.
+
+    The container gets a unique name, unless `options` give one; it is
+    `value`, and is removed with `docker rm -f` if the call times out or is
+    cancelled. With `detach`, the call returns once the container has started.
+    """
+    name = None
+    for i, v in enumerate(options):
+        if v == "--name":
+            if i + 1 == len(options):
+                raise ValueError("option --name needs a value")
+            name = options[i + 1]
+        elif v.startswith("--name="):
+            name = v[len("--name=") :]
+    args = ["docker", "run"]
+    if name is None:
+        name = "minidocker-aio-" + uuid.uuid4().hex[:12]
+        args.extend(["--name", name])
+    if remove:
+        args.append("--rm")
+    if detach:
+        args.append("--detach")
+    if input is not None:
+        args.append("--interactive")
+    args.extend([*options, image, *command])
+    try:
+        result = await run_command(args, input=input, timeout=timeout)
+    except asyncio.CancelledError:
+        await asyncio.shield(_remove(name))
+        raise
+    result.value = name
+    if result.timed_out:
+        # Killing the client leaves the container running.
+        await _remove(name)
+    if check:
+        result.check()
+    return result
+
+
+async def _remove(name):
+    await run_command(["docker", "rm", "--force", name], timeout=60)
+
+
+async def exec(
+    container, command, *, options=(), timeout=None, check=False, input=None
+):
+    """`docker exec options container command`. A timeout or cancellation
+    kills the `docker exec` client; the command in the container may go on
+    until the container stops."""
+    args = ["docker", "exec"]
+    if input is not None:
+        args.append("--interactive")
+    args.extend([*options, container, *command])
+    return await run_command(args, input=input, timeout=timeout, check=check)
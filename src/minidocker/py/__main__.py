@@ -14,15 +14,42 @@ the process of building the Docker image does not make use of anything outside o
 import argparse
 import sys
 
+from .._trace import TRACE_ENV, tracer
+
 
 def main(args):
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="write a Chrome trace of build phases and subprocesses to FILE (env {})".format(
+            TRACE_ENV
+        ),
+    )
     parser.add_argument("subcommand")
-    subcommand, args = parser.parse_known_args(args)
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    # Options of minidocker.py itself come before the subcommand;
+    # everything after it is left to the subcommand.
+    subcommand = parser.parse_args(args)
+    args = subcommand.args
     cmd = subcommand.subcommand
+    if subcommand.trace:
+        tracer.start(subcommand.trace)
     if cmd == "build":
         from ._build import main as run
 
+        run(args)
+    elif cmd == "build-all":
+        from ._build_all import main as run
+
+        run(args)
+    elif cmd == "deps":
+        from ._deps_image import main as run
+
+        run(args)
+    elif cmd == "cache":
+        from ._volumes import main as run
+
         run(args)
     elif cmd == "run":
         from ._run import main as run
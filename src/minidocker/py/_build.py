@@ -1,10 +1,12 @@
 import pathlib
 
-from . import _build_for_pkg, _build_for_proj
-
 
 def main(args):
     if pathlib.Path("docker").is_dir():
+        from . import _build_for_proj
+
         _build_for_proj.build(args)
     else:
+        from . import _build_for_pkg
+
         _build_for_pkg.build(args)
@@ -0,0 +1,238 @@
+import argparse
+import os
+import re
+import shlex
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from .._find_image import find_image, split_tag
+from .._prefetch import repository, start_prefetch
+from .._trace import run
+from .._util import get_cache_dir, get_repo, make_datetime_version
+from ._session import StepTimer
+from ._util import toml
+
+
+DEFAULT_ROOT = Path.home() / "work" / "src"
+
+_PARENT_RE = re.compile(r"""--parent(?:=|\s+)("[^"]*"|'[^']*'|\$\([^)]*\)|\S+)""")
+_FIND_IMAGE_RE = re.compile(r"find-(?:local-|remote-)?image\s+([^\s)\"']+)")
+
+
+def _parse_parent(value):
+    # The parent image in a `--parent` argument: a literal name, or the name
+    # passed to `find-image` in a command substitution. `None` if neither.
+    value = value.strip("\"'")
+    m = _FIND_IMAGE_RE.search(value)
+    if m:
+        return m.group(1)
+    if "$" in value:
+        return None
+    return value
+
+
+def find_parent(path):
+    """The parent image of the repo at `path`: `[tool.minidocker] parent` in
+    `pyproject.toml` if set, else the `--parent` argument in its `build` script.
+
+    The name may lack a tag, in which case the latest is meant.
+    """
+    try:
+        with open(os.path.join(path, "pyproject.toml"), "rb") as file:
+            z = toml.load(file).get("tool", {}).get("minidocker", {}).get("parent")
+    except (OSError, ValueError):
+        z = None
+    if z:
+        return z
+    try:
+        with open(os.path.join(path, "build")) as file:
+            script = file.read()
+    except OSError:
+        return None
+    m = _PARENT_RE.search(script)
+    return _parse_parent(m.group(1)) if m else None
+
+
+class Repo:
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.proj = get_repo(path).project_name
+        except (OSError, KeyError):
+            self.proj = os.path.basename(path)
+        self.parent = find_parent(path)
+        self.depends = None  # the `Repo` that builds the parent image, if any
+        self.status = "pending"
+        self.seconds = 0.0
+        self.log = None
+
+    def __repr__(self):
+        return "Repo({!r})".format(self.path)
+
+
+def find_repos(root, only=None):
+    """Repos directly under `root` that have `.git` and `pyproject.toml`,
+    with parent/child links among them."""
+    repos = []
+    for p in sorted(Path(root).iterdir()):
+        if only and p.name not in only:
+            continue
+        if (p / ".git").exists() and (p / "pyproject.toml").is_file():
+            repos.append(Repo(str(p)))
+    by_proj = {r.proj: r for r in repos}
+    for r in repos:
+        if r.parent:
+            repo, tag = split_tag(r.parent)
+            # A dev image of another repo, named "<proj>:dev" by `build`.
+            if tag in (None, "dev") and repo in by_proj and by_proj[repo] is not r:
+                r.depends = by_proj[repo]
+    return repos
+
+
+def check_cycles(repos):
+    for r in repos:
+        seen = [r]
+        x = r.depends
+        while x is not None:
+            if x in seen:
+                raise ValueError(
+                    "cyclic parents: {}".format(" -> ".join(v.proj for v in seen + [x]))
+                )
+            seen.append(x)
+            x = x.depends
+
+
+def build_command(repo):
+    # Prefer the repo's own `build` script, which may pass more options;
+    # otherwise build with the parent found in `pyproject.toml`.
+    if os.path.isfile(os.path.join(repo.path, "build")):
+        return ["bash", "build"]
+    if repo.parent is None:
+        return None
+    if repo.depends is not None:
+        parent = repo.depends.proj + ":dev"
+    elif split_tag(repo.parent)[1] is None:
+        parent = find_image(repo.parent) or repo.parent
+    else:
+        parent = repo.parent
+    return [sys.executable, "-m", "minidocker.py", "build", "--parent", parent]
+
+
+def _build_one(repo, log_dir):
+    args = build_command(repo)
+    if args is None:
+        return "no parent", 0.0
+    repo.log = os.path.join(log_dir, os.path.basename(repo.path) + ".log")
+    t0 = time.perf_counter()
+    with open(repo.log, "w") as file:
+        file.write("$ {}\n".format(shlex.join(args)))
+        file.flush()
+        proc = run(args, cwd=repo.path, stdout=file, stderr=file)
+    return "ok" if proc.returncode == 0 else "failed", time.perf_counter() - t0
+
+
+def build_all(repos, *, jobs, log_dir):
+    """Build the dev images of `repos`, at most `jobs` at a time.
+
+    A repo starts as soon as the repo that builds its parent image, if any,
+    has succeeded; if that failed, the repo is skipped.
+    """
+    check_cycles(repos)
+    pending = list(repos)
+    running = {}
+    with ThreadPoolExecutor(max(1, jobs)) as pool:
+        while pending or running:
+            for r in list(pending):
+                if r.depends is None or r.depends.status == "ok":
+                    pending.remove(r)
+                    r.status = "running"
+                    print("started  {}".format(r.proj), flush=True)
+                    running[pool.submit(_build_one, r, log_dir)] = r
+                elif r.depends.status in ("failed", "skipped", "no parent"):
+                    pending.remove(r)
+                    r.status = "skipped"
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                r = running.pop(future)
+                try:
+                    r.status, r.seconds = future.result()
+                except Exception as e:
+                    r.status = "failed"
+                    print(r.proj, e, file=sys.stderr)
+                print(
+                    "finished {} ({}, {:.1f}s)".format(r.proj, r.status, r.seconds),
+                    flush=True,
+                )
+    return repos
+
+
+def summary(repos):
+    timer = StepTimer()
+    for r in repos:
+        timer.add(r.proj, r.seconds, r.status)
+    z = [timer.summary("repo")]
+    failed = [r for r in repos if r.status == "failed"]
+    if failed:
+        z.append("")
+        z.extend("log of {}: {}".format(r.proj, r.log) for r in failed)
+    return "\n".join(z)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        prog="minidocker.py build-all",
+        description="build the dev images of all repos under a directory, "
+        "parents before children",
+    )
+    parser.add_argument("--root", default=str(DEFAULT_ROOT))
+    parser.add_argument(
+        "--jobs", type=int, default=4, help="number of builds to run at a time"
+    )
+    parser.add_argument("--only", nargs="+", help="names of the repos to build")
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="first start pulling newer versions of the parent images that are "
+        "not built here, in the background",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="show the repos and their parents"
+    )
+    args = parser.parse_args(args)
+
+    repos = find_repos(args.root, args.only)
+    check_cycles(repos)
+    if args.dry_run:
+        for r in repos:
+            print(
+                "{}: parent {}{}".format(
+                    r.proj,
+                    r.parent,
+                    " (built here by {})".format(r.depends.proj) if r.depends else "",
+                )
+            )
+        return
+
+    if args.prefetch:
+        # Pulls of the outside parents overlap with the builds of the first repos.
+        names = [repository(r.parent) for r in repos if r.parent and r.depends is None]
+        if names:
+            start_prefetch(names)
+
+    log_dir = get_cache_dir("build-all", make_datetime_version())
+    t0 = time.perf_counter()
+    build_all(repos, jobs=args.jobs, log_dir=log_dir)
+    print()
+    print(summary(repos))
+    print(
+        "\n{} repos in {:.1f}s; logs in {}".format(
+            len(repos), time.perf_counter() - t0, log_dir
+        )
+    )
+    # Repos without a parent, and those that build on them, are not failures.
+    if any(r.status == "failed" for r in repos):
+        sys.exit(1)
@@ -1,28 +1,95 @@
+import hashlib
+import json
 import os
+import shlex
 import string
+import tempfile
+import time
 import subprocess
 import argparse
 import shutil
 
 
-from .._util import get_project_name, run_command, get_git_branch
+from .._trace import run
+from .._util import (
+    get_project_name,
+    run_command,
+    run_command_for_output,
+    run_command_streaming_input,
+    run_in_thread,
+    get_git_branch,
+)
+from ._context import (
+    copy_source,
+    prune_command,
+    format_size,
+    git_files,
+    write_tar,
+)
+from ._session import ContainerSession, StepTimer
 from ._util import (
     parse_pyproject,
     get_package_name,
+    get_requirements,
 )
 
 
 DOCKER_SRCDIR = "/tmp/src"
 # Copy project repo to this location in the image.
 
-PYPROJECT = parse_pyproject()
-PROJ = get_project_name()
-PKG = get_package_name()
+FINGERPRINT_LABEL = "minidocker.fingerprint"
+# Image label on `<proj>:dev` recording what its dependency install was built from.
+
+CONTEXT_DOCKERFILE = ".minidocker.Dockerfile"
+# Name of the generated Dockerfile inside a build context made by `send_context`.
+
+
+UV_IMAGE = os.environ.get("MINIDOCKER_UV_IMAGE", "ghcr.io/astral-sh/uv:latest")
+# Image that `uv` is taken from, for `--installer uv`; it is not left in the dev image.
+
+
+_INSTALL_COMMENT = """\
+# Install all the required and optional dependencies of the package, but not the
+# package itself. They are listed here rather than read from the source tree, so this
+# layer is reused until the dependencies change, regardless of edits to the code.
+# Downloaded and built wheels persist across builds in a BuildKit cache mount.
+# pip also picks up wheels from build context "wheelhouse", which may be a host
+# directory shared across projects.
+"""
+
 
+def install_block(installer):
+    # The Dockerfile instruction that installs the dependencies of the package.
+    reqs = get_requirements(parse_pyproject())
+    if not reqs:
+        return ""
+    if installer == "uv":
+        # The lock file, from build context "lock", has every package pinned
+        # with hashes, so uv installs them in parallel without resolving.
+        return (
+            "RUN --mount=type=cache,target=/root/.cache/uv \\\n"
+            "    --mount=type=bind,from=wheelhouse,target=/wheelhouse \\\n"
+            "    --mount=type=bind,from=lock,target=/lock \\\n"
+            "    --mount=from={},source=/uv,target=/usr/local/bin/uv \\\n"
+            '    UV_LINK_MODE=copy uv pip install --python "$(command -v python)" \\\n'
+            "        --require-hashes --no-deps --find-links /wheelhouse \\\n"
+            "        -r /lock/requirements.txt\n".format(UV_IMAGE)
+        )
+    return (
+        "RUN --mount=type=cache,target=/root/.cache/pip \\\n"
+        "    --mount=type=bind,from=wheelhouse,target=/wheelhouse \\\n"
+        "    python -m pip install --find-links /wheelhouse \\\n"
+        "        {}\n".format(" \\\n        ".join(shlex.quote(r) for r in reqs))
+    )
 
-def dev_dockerfile(*, parent, docker_srcdir):
+
+def dev_dockerfile(*, parent, docker_srcdir, installer="pip", base=None):
+    """The Dockerfile of the dev image. If `base` is given, it is a shared image
+    made by `deps_dockerfile` from `parent` that has the dependencies installed,
+    and the dev image only adds the source code to it."""
     t = string.Template("""\
-FROM ${PARENT}
+# syntax=docker/dockerfile:1
+FROM ${BASE}
 USER root
 
 ENV PARENT_IMAGE=${PARENT}
@@ -30,109 +97,622 @@ ENV PARENT_IMAGE=${PARENT}
 # If the repo needs non-Python dependencies, will need a mechanism
 # to insert a block to install other things, or use user-defined Dockerfile.
 
-# Install the package of the current repo along with all its required and optional
-# dependencies. Then, uninstall the project package itself,
-# leaving the dependencies in place. The source code is left in the image in order to run tests;
+${INSTALL}
+# The source code is left in the image in order to run tests;
 # otherwise it will be largely forgotten.
 # Dev and test within the container will use volume-mapped live code.
 
 COPY --chown=docker-user:docker-user . ${DOCKER_SRCDIR}
 
-RUN pip-install ${DOCKER_SRCDIR}/[${EXTRAS}] \\
-    && python -m pip uninstall -y ${NAME}
+USER docker-user
+""")
+
+    if base:
+        install = "# The dependencies are installed in the shared image.\n"
+    else:
+        install = _INSTALL_COMMENT + install_block(installer)
+    return t.substitute(
+        BASE=base or parent,
+        PARENT=parent,
+        DOCKER_SRCDIR=docker_srcdir,
+        INSTALL=install,
+    )
+
+
+def deps_dockerfile(*, parent, installer="pip"):
+    """The Dockerfile of a shared dependency image; see `_deps_image`."""
+    t = string.Template("""\
+# syntax=docker/dockerfile:1
+FROM ${PARENT}
+USER root
+
+ENV PARENT_IMAGE=${PARENT}
 
+${INSTALL}
 USER docker-user
 """)
+    return t.substitute(
+        PARENT=parent, INSTALL=_INSTALL_COMMENT + install_block(installer)
+    )
+
 
-    pyproj = PYPROJECT["project"]
-    name = pyproj["name"]
+def inspect_image(name):
     try:
-        deps = pyproj["optional-dependencies"]
-        extras = ",".join(deps.keys())
-    except KeyError:
-        extras = ""
+        z = run_command_for_output(["docker", "image", "inspect", name])
+    except subprocess.CalledProcessError:
+        return None
+    return json.loads(z)[0]
 
-    return t.substitute(
-        PARENT=parent, DOCKER_SRCDIR=docker_srcdir, EXTRAS=extras, NAME=name
+
+def dev_fingerprint(*, parent, dockerfile, lock=None):
+    """Hash of everything the dependency install in the dev image depends on:
+    the parent image ID, the dependencies and extras in `pyproject.toml`,
+    the Dockerfile text, and the lock file, if any.
+
+    Return `None` if the parent image is not available locally.
+    """
+    image = inspect_image(parent)
+    if image is None:
+        return None
+    pyproj = parse_pyproject()["project"]
+    z = {
+        "parent": image["Id"],
+        "requires-python": pyproj.get("requires-python"),
+        "dependencies": pyproj.get("dependencies", []),
+        "optional-dependencies": pyproj.get("optional-dependencies", {}),
+        "dockerfile": dockerfile,
+    }
+    if lock:
+        with open(lock, "rb") as file:
+            z["lock"] = hashlib.sha256(file.read()).hexdigest()
+    return hashlib.sha256(json.dumps(z, sort_keys=True).encode()).hexdigest()
+
+
+def context_files(context):
+    """Files to send as build context.
+
+    "git": the files tracked by git;
+    "deps": only what the dependency install needs, i.e. `pyproject.toml`;
+    the image then does not contain the source code.
+    """
+    if context == "git":
+        return git_files()
+    if context == "deps":
+        return ["pyproject.toml"]
+    raise ValueError("unknown build context {!r}".format(context))
+
+
+def build_context_writer(files, dockerfile):
+    # Return a function that writes the build context as a tar stream,
+    # including the generated Dockerfile and a `.dockerignore` that keeps
+    # both out of the image.
+    ignore = b""
+    if ".dockerignore" in files:
+        files = [f for f in files if f != ".dockerignore"]
+        with open(".dockerignore", "rb") as file:
+            ignore = file.read().rstrip(b"\n") + b"\n"
+    ignore += "{}\n.dockerignore\n".format(CONTEXT_DOCKERFILE).encode()
+    extra = {CONTEXT_DOCKERFILE: dockerfile.encode(), ".dockerignore": ignore}
+
+    def write(fileobj):
+        # The size of the files before, from their `lstat`; the working
+        # directory is not walked, since that is what the git context avoids.
+        before = 0
+        for f in files:
+            try:
+                before += os.lstat(f).st_size
+            except FileNotFoundError:
+                pass
+        nbytes = write_tar(fileobj, files, extra)
+        print(
+            "Build context: {} file(s) of {}, sent as {}".format(
+                len(files), format_size(before), format_size(nbytes)
+            )
+        )
+
+    return write
+
+
+def pin_parent(parent):
+    """Return `parent` as "repo@sha256:...", pinned to the content digest of the
+    image the tag refers to, or `parent` unchanged if the digest is not known
+    (e.g. the image was built locally)."""
+    from .._find_image import resolve_image, split_tag
+
+    z = resolve_image(parent)
+    if z["image"] is None or z["digest"] is None:
+        return parent
+    pinned = "{}@{}".format(split_tag(z["image"])[0], z["digest"])
+    if z["pull"]:
+        print(
+            'Remote "{}" differs from the local image; it will be pulled as "{}"'.format(
+                z["image"], pinned
+            )
+        )
+    else:
+        print('Parent "{}" is up to date; using "{}"'.format(parent, pinned))
+    return pinned
+
+
+def _docker_build(dockerfile, tag, *, files, labels, force, wheelhouse, lock):
+    # Build `dockerfile` as `tag` with a tar stream of `files` as the build
+    # context, or the whole working directory if `files` is `None`.
+    # The dependency layer is rebuilt whenever the fingerprint changes, so the
+    # layer cache is bypassed only when forced.
+    # The Dockerfile always mounts build context "wheelhouse"; use an empty one
+    # if none is given. The lock file goes in build context "lock".
+    with tempfile.TemporaryDirectory() as empty, tempfile.TemporaryDirectory() as lockdir:
+        if lock:
+            shutil.copyfile(lock, os.path.join(lockdir, "requirements.txt"))
+        args = [
+            "docker",
+            "build",
+            *(["--no-cache"] if force else []),
+            "--build-context",
+            "wheelhouse=" + os.path.abspath(wheelhouse or empty),
+            *(["--build-context", "lock=" + lockdir] if lock else []),
+        ]
+        for k, v in labels.items():
+            args.extend(["--label", "{}={}".format(k, v)])
+        args.extend(["-t", tag])
+        env = dict(os.environ, DOCKER_BUILDKIT="1")
+        if files is None:
+            run_command(args + ["-f", "-", "."], input=dockerfile.encode(), env=env)
+        else:
+            run_command_streaming_input(
+                args + ["-f", CONTEXT_DOCKERFILE, "-"],
+                build_context_writer(files, dockerfile),
+                env=env,
+            )
+
+
+def _lock(installer):
+    if installer == "uv" and get_requirements(parse_pyproject()):
+        from ._lock import lock_requirements
+
+        return lock_requirements()
+    return None
+
+
+def build_shared_deps(*, parent, force=False, wheelhouse=None, installer="pip"):
+    """Return the tag of the shared image that has the dependencies installed
+    on `parent`, building it unless it exists and not `force`; see `_deps_image`.
+
+    After a build, shared images beyond the disk budget are garbage-collected.
+    """
+    from ._deps_image import (
+        DEPS_LABEL,
+        PARENT_ID_LABEL,
+        PARENT_LABEL,
+        deps_key,
+        deps_tag,
+        gc,
+        record_use,
+    )
+
+    image = inspect_image(parent)
+    if image is None:
+        run_command(["docker", "pull", parent])
+        image = inspect_image(parent)
+    lock = _lock(installer)
+    key = deps_key(image["Id"], installer, lock)
+    tag = deps_tag(key)
+    built = force or inspect_image(tag) is None
+    if built:
+        print('Building shared dependency image "{}"'.format(tag))
+        _docker_build(
+            deps_dockerfile(parent=parent, installer=installer),
+            tag,
+            files=[],
+            labels={
+                DEPS_LABEL: key,
+                PARENT_LABEL: parent,
+                PARENT_ID_LABEL: image["Id"],
+            },
+            force=force,
+            wheelhouse=wheelhouse,
+            lock=lock,
+        )
+    else:
+        print('Using shared dependency image "{}"'.format(tag))
+    record_use(key)
+    if built:
+        try:
+            for z in gc():
+                print('Removed shared dependency image "{}"'.format(z["tag"]))
+        except subprocess.CalledProcessError as e:
+            print("Garbage collection of shared dependency images failed: {}".format(e))
+    return tag
+
+
+def build_dev(
+    *,
+    parent,
+    tag,
+    force=False,
+    wheelhouse=None,
+    context="git",
+    installer="pip",
+    shared_deps=False,
+):
+    """Build the dev image, unless one with the same fingerprint exists and not `force`.
+
+    Return whether the image was rebuilt. If not, the source code in the image is
+    outdated; use `run_container` with `refresh_source=True` to run on the current code.
+
+    `wheelhouse` is a host directory of wheels, possibly shared across projects,
+    that pip searches in addition to the package index.
+
+    `context` is "full" to send the whole working directory as build context,
+    as `docker build .` does, or one of the choices of `context_files`, in which
+    case a tar stream of just those files is sent.
+
+    `installer` is "pip", which resolves the dependencies in the build, or "uv",
+    which installs from a lock file made on the host by `lock_requirements`.
+
+    If `shared_deps`, the dependencies are installed in a shared image
+    (see `build_shared_deps`), and the dev image is built on it.
+    """
+    base = None
+    lock = None
+    if shared_deps:
+        base = build_shared_deps(
+            parent=parent, force=force, wheelhouse=wheelhouse, installer=installer
+        )
+    else:
+        lock = _lock(installer)
+    dockerfile = dev_dockerfile(
+        parent=parent, docker_srcdir=DOCKER_SRCDIR, installer=installer, base=base
     )
+    fingerprint = dev_fingerprint(
+        parent=base or parent, dockerfile=dockerfile, lock=lock
+    )
+    if not force and fingerprint:
+        image = inspect_image(tag)
+        if (
+            image
+            and (image["Config"]["Labels"] or {}).get(FINGERPRINT_LABEL) == fingerprint
+        ):
+            print(
+                'Dependencies of "{}" are unchanged (fingerprint {}); skipping rebuild. '
+                "Use `--force` to rebuild.".format(tag, fingerprint[:12])
+            )
+            return False
+    _docker_build(
+        dockerfile,
+        tag,
+        files=None if context == "full" else context_files(context),
+        labels={FINGERPRINT_LABEL: fingerprint} if fingerprint else {},
+        force=force,
+        wheelhouse=wheelhouse,
+        lock=lock,
+    )
+    return True
+
 
+def run_container(opts, image, command, *, refresh_source=False, remove=True):
+    """Run a container to completion.
 
-def build_dev(*, parent, tag):
-    dockerfile = dev_dockerfile(parent=parent, docker_srcdir=DOCKER_SRCDIR)
-    run_command(
-        ["docker", "build", "--no-cache", "-t", tag, "-f", "-", "."],
-        input=dockerfile.encode(),
+    `opts` are options for `docker run`.
+    If `refresh_source`, the files tracked by git are copied over `DOCKER_SRCDIR`
+    in the container before it starts, and the others there are deleted, so that
+    it runs on the current code rather than the copy taken when the image was
+    built, if any.
+    """
+    if not refresh_source:
+        run_command(
+            ["docker", "run", *(["--rm"] if remove else []), *opts, image, *command]
+        )
+        return
+    cid = run_command_for_output(
+        ["docker", "create", *opts, image, *prune_command(DOCKER_SRCDIR), *command]
     )
+    try:
+        copy_source(cid, DOCKER_SRCDIR)
+        run_command(["docker", "start", "--attach", cid])
+    finally:
+        if remove:
+            run(["docker", "rm", cid], capture_output=True)
 
 
 def parse_args(args):
     parser = argparse.ArgumentParser()
     parser.add_argument("--parent", required=True, help="full tag of parent image")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="rebuild the dev image even if its dependency fingerprint is unchanged",
+    )
+    parser.add_argument(
+        "--pin-digest",
+        action="store_true",
+        help="build FROM the parent's content digest; pull only if it differs "
+        "from the local image",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="start pulling a newer parent image, if any, in the background "
+        "for later builds",
+    )
+    parser.add_argument(
+        "--wheelhouse",
+        help="host directory of wheels, possibly shared across projects, for pip to use",
+    )
+    parser.add_argument(
+        "--installer",
+        choices=["pip", "uv"],
+        default=None,
+        help="install the dependencies with pip, resolving them in the build, or with "
+        "uv from a hashed lock file resolved on the host (requirements.lock in the "
+        "repo if present, else cached); default: [tool.minidocker] installer in "
+        "pyproject.toml, or pip",
+    )
+    parser.add_argument(
+        "--shared-deps",
+        action="store_true",
+        default=None,
+        help="install the dependencies in an image shared by all projects with the "
+        "same dependencies and parent, and build the dev image on it; default: "
+        "[tool.minidocker] shared-deps in pyproject.toml",
+    )
+    parser.add_argument(
+        "--context",
+        choices=["git", "deps", "full"],
+        default="git",
+        help="build context to send: files tracked by git (default), only "
+        "pyproject.toml, or the whole working directory",
+    )
+    parser.add_argument(
+        "--test-workers",
+        type=int,
+        default=1,
+        help="run the tests in this many containers in parallel, "
+        "balanced by the durations of earlier runs",
+    )
+    parser.add_argument(
+        "--affected-tests",
+        action="store_true",
+        default=None,
+        help="run only the tests affected by the changes since the last green run, "
+        "by per-test coverage, with a periodic full run; default: [tool.minidocker] "
+        "affected-tests in pyproject.toml",
+    )
+    parser.add_argument(
+        "--full-tests",
+        action="store_true",
+        help="run all tests, even after a cached pass, and record their coverage map "
+        "for `--affected-tests`",
+    )
+    parser.add_argument(
+        "--no-test-cache",
+        action="store_true",
+        help="run the pre-commit hook and tests even if they passed before on the "
+        "same tree, image and options",
+    )
     args, more_args = parser.parse_known_args(args)
 
     return vars(args), more_args
 
 
-def build(args):
-    kwargs, extra_args = parse_args(args)
-    devimg = PROJ + ":dev"
-    build_dev(parent=kwargs["parent"], tag=devimg)
-    branch = get_git_branch()
-    if branch in ("main", "master", "release"):
-        run_command(["bash", ".githooks/pre-commit"])
-        run_command(
-            [
-                "docker",
-                "run",
-                "--rm",
-                "-e",
-                "IMAGE_NAME=" + PROJ,
-                "-e",
-                "IMAGE_VERSION=dev",
-                "-e",
-                "PKG=" + PKG,
-                "-e",
-                "PROJ=" + PROJ,
-                "--workdir",
-                DOCKER_SRCDIR,
-                "-e",
-                "PYTHONPATH=" + DOCKER_SRCDIR + "/src",
-                *extra_args,
-                devimg,
-                "py.test",
-                "--cov={}".format(PKG),
-                "tests",
-            ]
+def run_tests(*, image, opts, workers, refresh_source, affected=False, full=False):
+    """Run the tests. If `affected`, run only those affected by the changes since
+    the last recorded run, unless `full` or a full run is due; see `_impact`.
+
+    Return whether all the tests were run.
+    """
+    pytest_args = ["py.test", "--cov={}".format(get_package_name())]
+    if affected:
+        from ._impact import record_impact, select_tests
+        from ._testing import find_test_files, run_tests_sharded
+
+        proj = get_project_name()
+        files = find_test_files()
+        image_id = inspect_image(image)["Id"]
+        selected, is_full, reason = select_tests(proj, files, image_id, full=full)
+        print(
+            "Selected {} of {} test files ({})".format(
+                len(selected), len(files), reason
+            ),
+            flush=True,
         )
-        if branch == "release":
+        test_map = {}
+        if selected:
+            # The sharded runner brings the coverage data out of the containers.
+            test_map = run_tests_sharded(
+                proj=proj,
+                image=image,
+                opts=opts,
+                pytest_args=pytest_args,
+                srcdir=DOCKER_SRCDIR,
+                workers=workers,
+                refresh_source=refresh_source,
+                files=selected,
+                contexts=True,
+            )
+        record_impact(proj, selected, test_map, is_full, image_id)
+        return is_full
+    if workers > 1:
+        from ._testing import run_tests_sharded
+
+        run_tests_sharded(
+            proj=get_project_name(),
+            image=image,
+            opts=opts,
+            pytest_args=pytest_args,
+            srcdir=DOCKER_SRCDIR,
+            workers=workers,
+            refresh_source=refresh_source,
+        )
+    else:
+        run_container(
+            opts, image, [*pytest_args, "tests"], refresh_source=refresh_source
+        )
+    return True
+
+
+def release(*, image, opts, workers, refresh_source, timer):
+    """Run the tests and build the package concurrently in one container session.
+
+    Unless tests are sharded, both run in the same container via `docker exec`.
+    The artifacts are streamed out to `dist/` only if the tests pass.
+    """
+    distdir = "/tmp/minidocker-dist"
+    with ContainerSession(image, opts, name=get_project_name() + "-release") as session:
+        if refresh_source:
+            session.put_files(
+                DOCKER_SRCDIR,
+                git_files(),
+                owner="docker-user:docker-user",
+                clean=True,
+            )
+
+        def package():
+            t0 = time.perf_counter()
+            proc = session.exec(
+                ["python", "-m", "build", "--outdir", distdir, "."],
+                workdir=DOCKER_SRCDIR,
+                capture=True,
+            )
+            return proc, time.perf_counter() - t0
+
+        packaging = run_in_thread(package)
+        with timer.step("tests"):
+            if workers > 1:
+                run_tests(
+                    image=image,
+                    opts=opts,
+                    workers=workers,
+                    refresh_source=refresh_source,
+                )
+            else:
+                proc = session.exec(
+                    ["py.test", "--cov={}".format(get_package_name()), "tests"],
+                    workdir=DOCKER_SRCDIR,
+                )
+                if proc.returncode:
+                    raise subprocess.CalledProcessError(proc.returncode, proc.args)
+        proc, seconds = packaging.result()
+        print(proc.stdout)
+        timer.add("package", seconds, "failed" if proc.returncode else "ok")
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+        with timer.step("fetch dist"):
             try:
                 shutil.rmtree("dist")
             except FileNotFoundError:
                 pass
-            subprocess.run(["docker", "rm", PROJ + "-release"], capture_output=True)
-            run_command(
-                [
-                    "docker",
-                    "run",
-                    "--workdir",
-                    DOCKER_SRCDIR,
-                    "--name",
-                    PROJ + "-release",
-                    devimg,
-                    "python",
-                    "-m",
-                    "build",
-                    ".",
-                ]
-            )
-            run_command(
-                ["docker", "cp", "{}-release:{}/dist".format(PROJ, DOCKER_SRCDIR), "./"]
+            os.mkdir("dist")
+            session.get_dir(distdir, "dist")
+    print('Release artifacts are saved in "dist/"')
+    # Successful release will create a `dist/*.tar.gz` and a `dist/*.whl`.
+    # Outside of Docker, upload the package to PyPI by
+    #   $ python3 -m twine upload dist/*
+
+
+def build(args):
+    kwargs, extra_args = parse_args(args)
+    timer = StepTimer()
+    try:
+        _build(kwargs, extra_args, timer)
+    finally:
+        if timer.steps:
+            print()
+            print(timer.summary())
+
+
+def _build(kwargs, extra_args, timer):
+    proj = get_project_name()
+    pkg = get_package_name()
+    devimg = proj + ":dev"
+    tool = parse_pyproject().get("tool", {}).get("minidocker", {})
+    with timer.step("dev image"):
+        parent = kwargs["parent"]
+        if kwargs["prefetch"]:
+            # This build uses `parent` as given; the pull, if any, is for the next.
+            from .._prefetch import repository, start_prefetch
+
+            start_prefetch([repository(parent)])
+        if kwargs["pin_digest"]:
+            parent = pin_parent(parent)
+        rebuilt = build_dev(
+            parent=parent,
+            tag=devimg,
+            force=kwargs["force"],
+            wheelhouse=kwargs["wheelhouse"],
+            context=kwargs["context"],
+            installer=kwargs["installer"] or tool.get("installer") or "pip",
+            shared_deps=kwargs["shared_deps"] or tool.get("shared-deps", False),
+        )
+    # With build context "deps" the image does not contain the source code.
+    refresh = not rebuilt or kwargs["context"] == "deps"
+    branch = get_git_branch()
+    if branch in ("main", "master", "release"):
+        from ._test_cache import lookup_pass, pass_key, record_pass
+
+        test_opts = [
+            "-e",
+            "IMAGE_NAME=" + proj,
+            "-e",
+            "IMAGE_VERSION=dev",
+            "-e",
+            "PKG=" + pkg,
+            "-e",
+            "PROJ=" + proj,
+            "--workdir",
+            DOCKER_SRCDIR,
+            "-e",
+            "PYTHONPATH=" + DOCKER_SRCDIR + "/src",
+            *extra_args,
+        ]
+        key = None
+        if branch != "release":
+            image = inspect_image(devimg)
+            if image:
+                key = pass_key(image_id=image["Id"], opts=test_opts)
+        if key and not kwargs["no_test_cache"] and not kwargs["full_tests"]:
+            record = lookup_pass(key)
+            if record:
+                print(
+                    "Cached pass: the pre-commit hook and tests passed on this tree "
+                    "and image at {}; skipping them. Use `--no-test-cache` to "
+                    "rerun.".format(
+                        time.strftime("%Y-%m-%d %H:%M", time.localtime(record["time"]))
+                    )
+                )
+                timer.add("pre-commit", 0, "cached")
+                timer.add("tests", 0, "cached")
+                return
+        with timer.step("pre-commit"):
+            run_command(["bash", ".githooks/pre-commit"])
+        if branch == "release":
+            release(
+                image=devimg,
+                opts=test_opts,
+                workers=kwargs["test_workers"],
+                refresh_source=refresh,
+                timer=timer,
             )
-            run_command(["docker", "rm", PROJ + "-release"])
-            print('Release artifacts are saved in "dist/"')
-            # Successful release will create a `dist/*.tar.gz` and a `dist/*.whl`.
-            # Outside of Docker, upload the package to PyPI by
-            #   $ python3 -m twine upload dist/*
+        else:
+            with timer.step("tests"):
+                ran_all = run_tests(
+                    image=devimg,
+                    opts=test_opts,
+                    workers=kwargs["test_workers"],
+                    refresh_source=refresh,
+                    affected=kwargs["affected_tests"]
+                    or tool.get("affected-tests", False),
+                    full=kwargs["full_tests"],
+                )
+            # Only a pass of the whole suite counts, and not if the hook has
+            # changed files, e.g. by formatting them.
+            if (
+                key
+                and ran_all
+                and pass_key(image_id=image["Id"], opts=test_opts) == key
+            ):
+                record_pass(key, project=proj, image=devimg, branch=branch)
     else:
         # Take a free ride to config githooks.
         # Do this only when in a development branch.
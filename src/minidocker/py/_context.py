@@ -0,0 +1,106 @@
+import io
+import os
+import tarfile
+
+from .._util import run_command_for_output, run_command_streaming_input
+
+
+def git_files():
+    """List the files tracked by git in the current directory, skipping
+    tracked files that have been deleted from the working tree."""
+    z = run_command_for_output(["git", "ls-files", "-z", "--cached"])
+    return [f for f in z.split("\0") if f and os.path.lexists(f)]
+
+
+def format_size(n):
+    for unit in ("B", "kB", "MB", "GB"):
+        if n < 1000 or unit == "GB":
+            return "{:.1f} {}".format(n, unit) if unit != "B" else "{} B".format(n)
+        n /= 1000
+
+
+class _Counter:
+    # File-like wrapper that counts the bytes written through it.
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.nbytes = 0
+
+    def write(self, data):
+        self.nbytes += len(data)
+        return self.fileobj.write(data)
+
+
+def write_tar(fileobj, files, extra=None):
+    """Write an uncompressed tar stream of `files` (paths relative to the current
+    directory) plus `extra`, a dict of in-memory members {name: bytes}, to `fileobj`.
+    A member of `extra` whose value is `None` is a directory writable by all.
+
+    The stream is produced on the fly, without a temp copy. Return the number of
+    bytes written.
+    """
+
+    def reset(info):
+        info.uid = info.gid = 0
+        info.uname = info.gname = ""
+        return info
+
+    out = _Counter(fileobj)
+    with tarfile.open(fileobj=out, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        for f in files:
+            tar.add(f, recursive=False, filter=reset)
+        for name, data in (extra or {}).items():
+            info = reset(tarfile.TarInfo(name))
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o1777
+                tar.addfile(info)
+                continue
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return out.nbytes
+
+
+def copy_into_container(container, dest, files, extra=None):
+    """Copy `files` (paths relative to the current directory) and `extra`
+    (see `write_tar`) into directory `dest` of a container, streaming
+    a tar archive to `docker cp`."""
+    run_command_streaming_input(
+        ["docker", "cp", "-", "{}:{}".format(container, dest)],
+        lambda fileobj: write_tar(fileobj, files, extra),
+    )
+
+
+SOURCE_MANIFEST = ".minidocker-files"
+# List of the files copied by `copy_source`, NUL-separated, in the source directory.
+
+_PRUNE_SCRIPT = """\
+import os, sys
+
+root = sys.argv[1]
+with open(os.path.join(root, "{}")) as file:
+    keep = set(file.read().split("\\0"))
+for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+    for name in filenames:
+        path = os.path.join(dirpath, name)
+        if os.path.relpath(path, root) not in keep:
+            os.remove(path)
+    if dirpath != root and not os.listdir(dirpath):
+        os.rmdir(dirpath)
+os.execvp(sys.argv[2], sys.argv[2:])
+""".format(SOURCE_MANIFEST)
+
+
+def copy_source(container, srcdir):
+    """Copy the files tracked by git over directory `srcdir` of a container
+    that has not started, with a manifest for `prune_command`."""
+    files = git_files()
+    manifest = "\0".join(files + [SOURCE_MANIFEST]).encode()
+    copy_into_container(container, srcdir, files, {SOURCE_MANIFEST: manifest})
+
+
+def prune_command(srcdir):
+    """Prefix of a container command that first deletes the files in `srcdir`
+    that `copy_source` did not copy, i.e. those of the image's copy of the
+    source that have since been deleted, so that they cannot be imported."""
+    return ["python", "-c", _PRUNE_SCRIPT, srcdir]
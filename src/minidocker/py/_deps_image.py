@@ -0,0 +1,241 @@
+"""
+Shared dependency images.
+
+With ``minidocker.py build --shared-deps``, the dependencies of a package are
+installed in an image ``minidocker-deps:<key>``, where the key hashes the parent
+image ID, the installer, and the normalized dependency set (the resolved lock
+with ``--installer uv``, else the requirements). The dev image of the project
+adds only the source code on top. Projects with the same dependencies and
+parent share the image, both its disk space and its build.
+
+Each use of a shared image is recorded in the cache directory. ``gc`` removes
+the images not used by any other image, least recently used first, that are
+older than ``MAX_AGE`` or exceed ``DISK_BUDGET`` in total.
+"""
+
+import argparse
+import calendar
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from .._trace import run
+from .._util import get_cache_dir, run_command_for_output
+from ._context import format_size
+from ._util import canonical_name, get_requirements, parse_pyproject
+from ._volumes import parse_size
+
+
+REPOSITORY = "minidocker-deps"
+
+DEPS_LABEL = "minidocker.deps"
+PARENT_LABEL = "minidocker.deps.parent"
+PARENT_ID_LABEL = "minidocker.deps.parent-id"
+# Labels of a shared image: its key, and the name and ID of its parent image.
+# Images built on it inherit the first.
+
+DISK_BUDGET = parse_size(os.environ.get("MINIDOCKER_DEPS_BUDGET", "20g"))
+# Total size of the shared images beyond what their parents take.
+
+MAX_AGE = 30 * 24 * 3600
+# Seconds after its last use that a shared image is removed regardless of size.
+
+
+def normalized_deps(lock=None):
+    """The dependency set as sorted lines, without comments or formatting:
+    the pinned packages with their hashes in `lock` if given, else the
+    requirements in `pyproject.toml`."""
+    if lock:
+        with open(lock) as file:
+            text = file.read()
+        # Join continuation lines and drop comments, e.g. "# via ...",
+        # which name the project.
+        text = re.sub(r"\\\n", " ", re.sub(r"#.*", "", text))
+        return sorted(
+            " ".join(line.split()) for line in text.splitlines() if line.strip()
+        )
+    z = set()
+    for req in get_requirements(parse_pyproject()):
+        rest = re.match(r"\s*[A-Za-z0-9._-]+(.*)", req, re.S).group(1)
+        z.add(canonical_name(req) + "".join(rest.split()))
+    return sorted(z)
+
+
+def deps_key(parent_id, installer, lock=None):
+    z = {
+        "parent": parent_id,
+        "installer": installer,
+        "deps": normalized_deps(lock),
+    }
+    return hashlib.sha256(json.dumps(z, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def deps_tag(key):
+    return "{}:{}".format(REPOSITORY, key)
+
+
+def _record(key):
+    return os.path.join(get_cache_dir("deps"), key)
+
+
+def record_use(key):
+    with open(_record(key), "a"):
+        pass
+    os.utime(_record(key))
+
+
+def last_used(key):
+    try:
+        return os.path.getmtime(_record(key))
+    except FileNotFoundError:
+        return None
+
+
+def _inspect(names):
+    # `docker image inspect` records of those of `names` that exist.
+    if not names:
+        return []
+    proc = run(["docker", "image", "inspect", *names], capture_output=True, text=True)
+    return json.loads(proc.stdout or "[]")
+
+
+def list_images():
+    """The shared images, least recently used first, each a dict with keys
+    "key", "tag", "parent", "size" (bytes beyond the parent's), "last_used"
+    and "in_use", whether other images are built on it."""
+    ids = run_command_for_output(
+        [
+            "docker",
+            "image",
+            "ls",
+            "--filter",
+            "label=" + DEPS_LABEL,
+            "--format",
+            "{{.ID}}",
+        ]
+    ).split()
+    infos = _inspect(sorted(set(ids)))
+    used = set()
+    shared = []
+    for info in infos:
+        key = (info["Config"]["Labels"] or {}).get(DEPS_LABEL)
+        if deps_tag(key) in (info.get("RepoTags") or []):
+            shared.append(info)
+        else:
+            used.add(key)
+
+    def parent_ref(info):
+        # By ID, since the name may be a digest reference, e.g. with
+        # `--pin-digest`, or a tag that has moved since.
+        labels = info["Config"]["Labels"]
+        return labels.get(PARENT_ID_LABEL) or labels.get(PARENT_LABEL)
+
+    parents = {parent_ref(info) for info in shared} - {None}
+    parent_size = {}
+    for info in _inspect(sorted(parents)):
+        for ref in [info["Id"], *(info.get("RepoTags") or [])]:
+            parent_size[ref] = info["Size"]
+    z = []
+    for info in shared:
+        labels = info["Config"]["Labels"]
+        key = labels[DEPS_LABEL]
+        parent = labels.get(PARENT_LABEL)
+        z.append(
+            {
+                "key": key,
+                "tag": deps_tag(key),
+                "parent": parent,
+                "size": info["Size"] - parent_size.get(parent_ref(info), 0),
+                "last_used": last_used(key)
+                or calendar.timegm(
+                    time.strptime(info["Created"][:19], "%Y-%m-%dT%H:%M:%S")
+                ),
+                "in_use": key in used,
+            }
+        )
+    z.sort(key=lambda v: v["last_used"])
+    return z
+
+
+def gc(budget=DISK_BUDGET, max_age=MAX_AGE, dry_run=False):
+    """Remove shared images that no other image is built on, least recently
+    used first, while they are older than `max_age` seconds or their total
+    size exceeds `budget` bytes. Return the removed images."""
+    images = list_images()
+    total = sum(v["size"] for v in images)
+    now = time.time()
+    removed = []
+    for image in images:
+        if image["in_use"]:
+            continue
+        if total <= budget and now - image["last_used"] <= max_age:
+            continue
+        if not dry_run:
+            z = run(
+                ["docker", "image", "rm", image["tag"]], capture_output=True, text=True
+            )
+            if z.returncode:
+                # E.g. a stopped container uses it; it stays, and so does its record.
+                print(
+                    'Could not remove "{}": {}'.format(image["tag"], z.stderr.strip()),
+                    file=sys.stderr,
+                )
+                continue
+            try:
+                os.remove(_record(image["key"]))
+            except FileNotFoundError:
+                pass
+        total -= image["size"]
+        removed.append(image)
+    return removed
+
+
+def _show(image):
+    return "{}  {:>10}  {}  {}{}".format(
+        image["tag"],
+        format_size(image["size"]),
+        time.strftime("%Y-%m-%d %H:%M", time.localtime(image["last_used"])),
+        image["parent"],
+        "  (in use)" if image["in_use"] else "",
+    )
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        prog="minidocker.py deps",
+        description="list or garbage-collect the shared dependency images",
+    )
+    parser.add_argument("action", choices=["ls", "gc"])
+    parser.add_argument(
+        "--budget",
+        default=None,
+        help="total size to keep, e.g. 20g (env MINIDOCKER_DEPS_BUDGET)",
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=MAX_AGE / 86400,
+        help="days after its last use that an image is removed",
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(args)
+
+    if args.action == "ls":
+        for image in list_images():
+            print(_show(image))
+        return
+    removed = gc(
+        parse_size(args.budget) if args.budget else DISK_BUDGET,
+        args.max_age * 86400,
+        args.dry_run,
+    )
+    for image in removed:
+        print(("would remove " if args.dry_run else "removed ") + _show(image))
+    print(
+        "{} image(s), {}".format(
+            len(removed), format_size(sum(v["size"] for v in removed))
+        )
+    )
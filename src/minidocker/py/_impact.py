@@ -0,0 +1,145 @@
+"""
+Test impact analysis for ``minidocker.py build --affected-tests``.
+
+A green run with per-test coverage contexts records, for each test file, the
+source files its tests executed, together with the commit it ran on. A later
+run selects the test files that were changed since that commit, or that cover
+a changed source file, or that have no record, e.g. new ones.
+
+The selection misses dependencies that coverage does not see, such as
+module-level code run at import, data files, or the environment. To bound that
+risk, all tests are run when the dev image has changed (e.g. a new parent or
+newly resolved dependencies), when a file in ``ALWAYS_FULL`` or a non-Python
+file of the package has changed, after ``FULL_RUN_EVERY`` incremental runs,
+and when the last full run is older than ``FULL_RUN_AGE``.
+"""
+
+import json
+import os
+import subprocess
+import time
+
+from .._util import get_cache_dir, run_command_for_output
+
+
+FULL_RUN_EVERY = int(os.environ.get("MINIDOCKER_FULL_TEST_EVERY", "10"))
+
+FULL_RUN_AGE = 7 * 24 * 3600
+
+ALWAYS_FULL = (
+    "pyproject.toml",
+    "setup.py",
+    "setup.cfg",
+    "tox.ini",
+    "pytest.ini",
+    ".coveragerc",
+    "conftest.py",
+    "requirements.lock",
+)
+# File names whose change can affect any test.
+
+
+def _path(proj):
+    return os.path.join(get_cache_dir("tests", proj), "impact.json")
+
+
+def load_impact(proj):
+    try:
+        with open(_path(proj)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(proj, data):
+    path = _path(proj)
+    with open(path + ".tmp", "w") as file:
+        json.dump(data, file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def changed_files(commit):
+    """Tracked files that differ between `commit` and the working tree;
+    `None` if `commit` is unknown, e.g. after a rebase and gc."""
+    try:
+        z = run_command_for_output(["git", "diff", "--name-only", "-z", commit, "--"])
+    except subprocess.CalledProcessError:
+        return None
+    return [f for f in z.split("\0") if f]
+
+
+def _forces_full(path):
+    if os.path.basename(path) in ALWAYS_FULL:
+        return True
+    # Package data, e.g. templates or config, that coverage does not track.
+    return path.startswith("src/") and not path.endswith(".py")
+
+
+def select_tests(proj, files, image_id, full=False):
+    """Choose among test files `files` those to run on dev image `image_id`.
+
+    Return `(selected, is_full, reason)`, where `is_full` says that all
+    of `files` are selected, and `reason` is a message explaining the choice.
+    """
+    if full:
+        return files, True, "full run requested"
+    data = load_impact(proj)
+    if data is None:
+        return files, True, "no coverage map recorded yet"
+    if data.get("image") != image_id:
+        return files, True, "dev image changed since the last recorded run"
+    if data["runs_since_full"] >= FULL_RUN_EVERY:
+        return (
+            files,
+            True,
+            "{} incremental runs since the last full run".format(
+                data["runs_since_full"]
+            ),
+        )
+    if time.time() - data["full_run_time"] > FULL_RUN_AGE:
+        return (
+            files,
+            True,
+            "last full run is older than {} days".format(FULL_RUN_AGE // 86400),
+        )
+    changed = changed_files(data["commit"])
+    if changed is None:
+        return files, True, "recorded commit {} not found".format(data["commit"][:12])
+    for f in changed:
+        if _forces_full(f):
+            return files, True, "{} changed".format(f)
+    changed = set(changed)
+    tests = data["tests"]
+    selected = [
+        f
+        for f in files
+        if f in changed or f not in tests or not changed.isdisjoint(tests[f])
+    ]
+    return (
+        selected,
+        len(selected) == len(files),
+        "{} changed files since {}".format(len(changed), data["commit"][:12]),
+    )
+
+
+def record_impact(proj, files, test_map, full, image_id):
+    """Record a green run of test files `files` on dev image `image_id`,
+    whose `coverage_map` is `test_map`, as the base of later selections.
+
+    Only runs on a clean working tree are recorded, since the base is a commit.
+    """
+    if run_command_for_output(["git", "status", "--porcelain", "--untracked-files=no"]):
+        print("Working tree has changes; coverage map not recorded", flush=True)
+        return
+    data = load_impact(proj)
+    if full or data is None:
+        data = {"tests": {}, "runs_since_full": 0, "full_run_time": time.time()}
+    else:
+        data["runs_since_full"] += 1
+    for f in files:
+        data["tests"][f] = sorted(test_map.get(f, ()))
+    # Drop deleted test files.
+    data["tests"] = {k: v for k, v in data["tests"].items() if os.path.isfile(k)}
+    data["commit"] = run_command_for_output(["git", "rev-parse", "HEAD"])
+    data["image"] = image_id
+    _save(proj, data)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from .._util import get_cache_dir, run_command
+from ._util import parse_pyproject
+
+
+LOCK_FILE = "requirements.lock"
+# A lock file committed in the repo, if any, is used (and kept up to date)
+# instead of one in the cache.
+
+HASH_PREFIX = "# minidocker deps-hash: "
+# First line of a lock file, recording what it was resolved from.
+
+
+def deps_hash(pyproject=None):
+    """Hash of what the lock is resolved from: the Python requirement,
+    the dependencies and the extras in `pyproject.toml`."""
+    pyproj = (pyproject or parse_pyproject())["project"]
+    z = {
+        "name": pyproj["name"],
+        "requires-python": pyproj.get("requires-python"),
+        "dependencies": pyproj.get("dependencies", []),
+        "optional-dependencies": pyproj.get("optional-dependencies", {}),
+    }
+    return hashlib.sha256(json.dumps(z, sort_keys=True).encode()).hexdigest()
+
+
+def _recorded_hash(path):
+    try:
+        with open(path) as file:
+            line = file.readline()
+    except FileNotFoundError:
+        return None
+    return line[len(HASH_PREFIX) :].strip() if line.startswith(HASH_PREFIX) else None
+
+
+def compile_lock(path, digest):
+    """Resolve the dependencies and all extras in `pyproject.toml` into `path`
+    with `uv pip compile`, pinned with hashes, for all platforms and the
+    Python versions of `requires-python`. The project itself is not included."""
+    if shutil.which("uv") is None:
+        raise FileNotFoundError(
+            "`uv` is needed to lock the dependencies; install it "
+            "(e.g. `pip install uv`) or use `--installer pip`"
+        )
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        run_command(
+            [
+                "uv",
+                "pip",
+                "compile",
+                "pyproject.toml",
+                "--all-extras",
+                "--universal",
+                "--generate-hashes",
+                "--no-header",
+                "--quiet",
+                "--output-file",
+                tmp,
+            ],
+            stdout=subprocess.DEVNULL,
+        )
+        with open(tmp) as file:
+            text = file.read()
+        with open(tmp, "w") as file:
+            file.write(HASH_PREFIX + digest + "\n" + text)
+        # `mkstemp` makes the file private.
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _confirm_adopt(path):
+    # A lock file without our header, e.g. one made by pip-compile, is
+    # replaced only if the user agrees.
+    if not sys.stdin.isatty():
+        return False
+    answer = input(
+        "{} was not made by minidocker. Replace it with a lock resolved by uv? "
+        "[y/N] ".format(path)
+    )
+    return answer.strip().lower() in ("y", "yes")
+
+
+def lock_requirements():
+    """Path of a lock file of the dependencies in `pyproject.toml`, resolving
+    them only if they have changed since the lock was made.
+
+    The lock is `LOCK_FILE` in the repo if it exists, so that it can be
+    committed; else it is cached by the hash of the dependencies.
+    """
+    digest = deps_hash()
+    if os.path.isfile(LOCK_FILE):
+        path = LOCK_FILE
+        if _recorded_hash(path) is None and not _confirm_adopt(path):
+            raise RuntimeError(
+                "{} was not made by minidocker; it would be replaced by a lock "
+                "resolved with `uv pip compile`. Move it away, or run the build "
+                "in a terminal to confirm, or use `--installer pip`".format(path)
+            )
+    else:
+        path = os.path.join(get_cache_dir("locks"), digest + ".txt")
+    if _recorded_hash(path) != digest:
+        print("Resolving the dependencies into {}".format(path), flush=True)
+        compile_lock(path, digest)
+    return path
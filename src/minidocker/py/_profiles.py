@@ -0,0 +1,299 @@
+"""
+Resource profiles for ``minidocker.py run``.
+
+A profile is a named set of settings that turn into ``docker run`` options,
+sized for the host where they are applied. Built-in profiles are in
+``PROFILES``; more, or overrides of the built-in ones, can be defined in a TOML
+file (see ``profiles_file``), e.g.
+
+    [torch]
+    extends = "default"         # the profile this one modifies; default "default"
+    shm = "25%"                 # /dev/shm size: "2gb", or percent of host RAM
+    memory = "80%"              # memory limit, likewise; unset for unlimited
+    cpus = 8                    # CPU quota
+    cpuset = "numa"             # "0-7", "numa" (the node with most free memory)
+                                # or "numa:1"; also pins memory to the node
+    ipc = "private"             # IPC namespace: "private", "shareable" or "host"
+    ulimits = {nofile = 65536, memlock = -1}   # soft[:hard]; -1 for unlimited
+    tz = "host"                 # TZ in the container: a zone name, "host", or ""
+    data_volume = "docker-data-volume"         # mounted at ~/mnt; "" for none
+    scratch = "4g"              # tmpfs for TMPDIR, sized like shm; "" for none
+    pytest_cache = "256m"       # tmpfs for the pytest cache; "" for none
+    tmpfs = {"/var/tmp" = "1g"}  # more tmpfs mounts, path = size
+    caches = ["pip", "ruff", "pycache"]  # or {pip = "20g", ...}; see `_volumes`
+    options = ["--pids-limit=4096"]            # any other `docker run` options
+
+Options the user passes to ``run`` take precedence over those of the profile.
+"""
+
+import os
+
+from .._util import host
+
+
+DEFAULT_PROFILE = os.environ.get("MINIDOCKER_PROFILE", "default")
+
+PROFILES = {
+    "default": {
+        "shm": "2gb",
+        "tz": "America/Los_Angeles",
+        "data_volume": "docker-data-volume",
+    },
+    # Scratch space in memory, and tool caches that persist across containers,
+    # so that installs, linting and imports in a new container start warm.
+    "dev": {
+        "extends": "default",
+        "scratch": "2g",
+        "pytest_cache": "256m",
+        "caches": ["pip", "ruff", "pycache"],
+    },
+    # PyTorch dataloader workers and other multiprocessing pass tensors
+    # through /dev/shm and hold many file descriptors; pinned memory needs
+    # an unlimited `memlock`. Pinning to one NUMA node keeps the workers'
+    # memory local and away from noisy neighbours.
+    "torch": {
+        "extends": "default",
+        "shm": "25%",
+        "cpuset": "numa",
+        "ipc": "private",
+        "ulimits": {"nofile": 65536, "memlock": -1},
+        "tz": "host",
+        "scratch": "10%",
+        "pytest_cache": "256m",
+        "caches": ["pip", "ruff", "pycache", "huggingface", "torch"],
+    },
+    # Everything shared with the host, for single-tenant machines.
+    "host": {
+        "extends": "default",
+        "ipc": "host",
+        "ulimits": {"nofile": 65536, "memlock": -1},
+        "tz": "host",
+    },
+}
+
+KEYS = (
+    "extends",
+    "shm",
+    "memory",
+    "cpus",
+    "cpuset",
+    "ipc",
+    "ulimits",
+    "tz",
+    "data_volume",
+    "scratch",
+    "pytest_cache",
+    "tmpfs",
+    "caches",
+    "options",
+)
+
+SCRATCH_DIR = "/tmp/scratch"
+PYTEST_CACHE_DIR = "/tmp/pytest-cache"
+
+
+def profiles_file():
+    """`$MINIDOCKER_PROFILES` if set, else `profiles.toml` under
+    `$XDG_CONFIG_HOME/minidocker` or `~/.config/minidocker`."""
+    path = os.environ.get("MINIDOCKER_PROFILES")
+    if path:
+        return path
+    return os.path.join(
+        os.environ.get("XDG_CONFIG_HOME")
+        or os.path.join(os.path.expanduser("~"), ".config"),
+        "minidocker",
+        "profiles.toml",
+    )
+
+
+def load_profiles(path=None):
+    """The built-in profiles updated by those in file `path` (default
+    `profiles_file()`), if it exists. A profile in the file is merged
+    over the built-in one of the same name, if any, else over the one
+    it `extends`."""
+    path = path or profiles_file()
+    try:
+        with open(path) as file:
+            text = file.read()
+    except FileNotFoundError:
+        text = None
+    defined = {}
+    if text is not None:
+        # Imported only when needed; most hosts have no profiles file.
+        from ._util import toml
+
+        defined = toml.loads(text)
+    for name, profile in defined.items():
+        unknown = set(profile) - set(KEYS)
+        if unknown:
+            raise ValueError(
+                "unknown key(s) {} in profile '{}' of '{}'".format(
+                    ", ".join(sorted(unknown)), name, path
+                )
+            )
+    z = {k: dict(v) for k, v in PROFILES.items()}
+    for name, profile in defined.items():
+        if name in z:
+            z[name].update(profile)
+        else:
+            z[name] = dict(profile, extends=profile.get("extends", "default"))
+    return z
+
+
+def resolve_profile(name, profiles=None):
+    """The settings of profile `name`, with those it `extends` filled in."""
+    if profiles is None:
+        profiles = load_profiles()
+    chain = []
+    while name is not None:
+        if name not in profiles:
+            raise ValueError(
+                "unknown profile '{}'; choose from {}".format(
+                    name, ", ".join(sorted(profiles))
+                )
+            )
+        if name in chain:
+            raise ValueError("cyclic profiles: {}".format(" -> ".join(chain + [name])))
+        chain.append(name)
+        name = profiles[name].get("extends")
+    z = {}
+    for name in reversed(chain):
+        for k, v in profiles[name].items():
+            if k == "ulimits":
+                # Merged, so that a profile can change one limit.
+                v = dict(z.get(k) or {}, **v)
+            z[k] = v
+    z.pop("extends", None)
+    return z
+
+
+def _size(value):
+    # "25%" of host RAM -> "<n>m"; anything else is passed on as is.
+    value = str(value)
+    if not value.endswith("%"):
+        return value
+    if host.memory is None:
+        return None
+    return "{}m".format(int(host.memory * float(value[:-1]) / 100) >> 20)
+
+
+def _free_memory(node):
+    # Free memory of NUMA node `node`, in kB.
+    try:
+        with open("/sys/devices/system/node/node{}/meminfo".format(node)) as file:
+            for line in file:
+                if "MemFree:" in line:
+                    return int(line.split()[-2])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _cpuset(value):
+    # -> (cpus, mems) for `--cpuset-cpus` and `--cpuset-mems`, each possibly `None`.
+    value = str(value)
+    if not value.startswith("numa"):
+        return value, None
+    nodes = host.numa_nodes
+    if len(nodes) < 2:
+        # Not a NUMA host; nothing to pin.
+        return None, None
+    _, _, node = value.partition(":")
+    if node:
+        node = int(node)
+        if node not in nodes:
+            raise ValueError(
+                "no NUMA node {}; the host has {}".format(
+                    node, ", ".join(map(str, nodes))
+                )
+            )
+    else:
+        node = max(nodes, key=_free_memory)
+    return nodes[node], str(node)
+
+
+def _ulimit(name, value):
+    value = str(value)
+    if ":" not in value:
+        value = "{}:{}".format(value, value)
+    return "{}={}".format(name, value)
+
+
+def profile_options(profile, opts=(), *, mountpoint):
+    """`docker run` options for the settings `profile` on this host,
+    leaving out those already set in `opts`. The data volume is mounted
+    at `mountpoint` in the container.
+
+    Return a dict with keys "shm", "resources", "data_volume", "mounts" and "tz",
+    each a list of options, so that the caller can place them, and "caches",
+    the tool caches to mount, as name -> size limit in bytes.
+    """
+
+    def given(*names):
+        return any(v.split("=")[0] in names for v in opts)
+
+    z = {"shm": [], "resources": [], "data_volume": [], "mounts": [], "tz": []}
+    ipc = profile.get("ipc")
+    if given("--ipc"):
+        ipc = [v for v in opts if v.startswith("--ipc=")][-1][len("--ipc=") :]
+    elif ipc:
+        z["resources"].append("--ipc=" + ipc)
+    # /dev/shm is the host's with `--ipc=host`, so its size is not ours to set.
+    if profile.get("shm") and ipc != "host" and not given("--shm-size"):
+        shm = _size(profile["shm"]) or PROFILES["default"]["shm"]
+        z["shm"].append("--shm-size=" + shm)
+    if profile.get("memory") and not given("--memory", "-m"):
+        memory = _size(profile["memory"])
+        if memory:
+            z["resources"].append("--memory=" + memory)
+    if profile.get("cpus") and not given("--cpus"):
+        z["resources"].append("--cpus={}".format(profile["cpus"]))
+    if profile.get("cpuset") and not given("--cpuset-cpus"):
+        cpus, mems = _cpuset(profile["cpuset"])
+        if cpus:
+            z["resources"].append("--cpuset-cpus=" + cpus)
+        if mems and not given("--cpuset-mems"):
+            z["resources"].append("--cpuset-mems=" + mems)
+    for name, value in (profile.get("ulimits") or {}).items():
+        if not any(v.startswith("--ulimit=" + name + "=") for v in opts):
+            z["resources"].append("--ulimit=" + _ulimit(name, value))
+    z["resources"].extend(profile.get("options") or [])
+    if profile.get("data_volume"):
+        z["data_volume"] = [
+            "--mount",
+            "source={},target={}".format(profile["data_volume"], mountpoint),
+        ]
+    tmpfs = dict(profile.get("tmpfs") or {})
+    env = {}
+    if profile.get("scratch"):
+        tmpfs[SCRATCH_DIR] = profile["scratch"]
+        env["TMPDIR"] = SCRATCH_DIR
+    if profile.get("pytest_cache"):
+        tmpfs[PYTEST_CACHE_DIR] = profile["pytest_cache"]
+        env["PYTEST_ADDOPTS"] = "-o cache_dir=" + PYTEST_CACHE_DIR
+    if tmpfs or profile.get("caches"):
+        # Not needed, and not imported, for profiles without mounts.
+        from ._volumes import cache_limits, cache_options, parse_size
+    for path, size in tmpfs.items():
+        size = _size(size)
+        z["mounts"].extend(
+            [
+                "--mount",
+                "type=tmpfs,destination={},tmpfs-mode=1777{}".format(
+                    path, ",tmpfs-size={}".format(parse_size(size)) if size else ""
+                ),
+            ]
+        )
+    for k, v in env.items():
+        if not any(x.startswith(k + "=") for x in opts):
+            z["mounts"].extend(["-e", "{}={}".format(k, v)])
+    z["caches"] = {}
+    if profile.get("caches"):
+        z["caches"] = cache_limits(profile["caches"])
+        z["mounts"].extend(cache_options(z["caches"], opts))
+    tz = profile.get("tz")
+    if tz == "host":
+        tz = host.timezone
+    if tz and not any(v.startswith("TZ=") for v in opts):
+        z["tz"] = ["-e", "TZ=" + tz]
+    return z
@@ -1,12 +1,11 @@
-import getpass
 import pathlib
-import platform
-import socket
-import subprocess
+import shlex
 from datetime import datetime, timezone
 from pathlib import Path
 
-from .._util import run_command
+from .._trace import run
+from .._util import host, run_command
+from ._profiles import DEFAULT_PROFILE, profile_options, resolve_profile
 
 
 def parse_args(args):
@@ -17,6 +16,10 @@ def parse_args(args):
     nb_port = 8888
     # gpu_devices=all
     gpu_devices = None
+    warm = False
+    warm_idle = None  # `_warm.DEFAULT_IDLE_TIMEOUT`
+    profile = DEFAULT_PROFILE
+    dry_run = False
 
     # You can specify specific GPUs to use, e.g.
     # -e NVIDIA_VISIBLE_DEVICES=none
@@ -25,7 +28,8 @@ def parse_args(args):
 
     # To restrict memory usage, do something like
     # --memory=8g
-    # Default is unlimited.
+    # Default is unlimited. Resource profiles, e.g. `--profile=torch`,
+    # set this and other limits; see `_profiles`.
     #
     # See https://georgeoffley.com/blog/shared-memory-in-docker.html
 
@@ -43,13 +47,13 @@ def parse_args(args):
         elif head == "-p":
             # Port forwarding, e.g.
             #   -p 8080:8080
-            opts.extend([head, args.pop[0]])
+            opts.extend([head, args.pop(0)])
         elif head == "-e":
             # Set env var, e.g.
             #   -e MYNAME=abc
             val = args.pop(0)
-            if head.startswith("NVIDIA_VISIBLE_DEVICES="):
-                gpu_devices = val.lstrip("NVIDIA_VISIBLE_DEVICES=")
+            if val.startswith("NVIDIA_VISIBLE_DEVICES="):
+                gpu_devices = val[len("NVIDIA_VISIBLE_DEVICES=") :]
             else:
                 opts.extend([head, val])
         elif head == "--nb_port":
@@ -58,6 +62,22 @@ def parse_args(args):
             nb_port = args.pop(0)
         elif head.startswith("--nb_port="):
             nb_port = head.lstrip("--nb_port=")
+        elif head == "--warm":
+            # Run the command in a long-lived container via `docker exec`,
+            # starting the container only if it is not running yet.
+            warm = True
+        elif head.startswith("--warm-idle="):
+            # Seconds after its last use that a warm container is removed.
+            warm = True
+            warm_idle = float(head[len("--warm-idle=") :])
+        elif head == "--profile":
+            # Named resource profile; see `_profiles`.
+            profile = args.pop(0)
+        elif head.startswith("--profile="):
+            profile = head[len("--profile=") :]
+        elif head == "--dry-run":
+            # Print the `docker run` command instead of running it.
+            dry_run = True
         elif head.startswith("-"):
             # Every other argument is captured and passed on to `docker run`.
             # For example, if there is an option called `--volume` which sets
@@ -102,6 +122,10 @@ where
         "opts": opts,
         "nb_port": nb_port,
         "gpu_devices": gpu_devices,
+        "warm": warm,
+        "warm_idle": warm_idle,
+        "profile": profile,
+        "dry_run": dry_run,
     }
 
 
@@ -117,12 +141,11 @@ def main(args):
     opts = kwargs["opts"]  # args to `docker run`
     nb_port = kwargs["nb_port"]
     gpu_devices = kwargs["gpu_devices"]
+    warm = kwargs["warm"]
 
     HOSTWORKDIR = pathlib.Path.home() / "work"
     DOCKERHOMEDIR = "/home/docker-user"
-    host_user = getpass.getuser()
-    host_os = platform.system()
-    host_ip = socket.gethostbyname(socket.gethostname())
+    host_user = host.user
 
     if ":" not in imagename and "/" not in imagename:
         # The image name is a single word: no namespace, no tag.
@@ -158,7 +181,7 @@ def main(args):
             )
 
         DOCKERSRCDIR = f"{DOCKERHOMEDIR}/{PROJ}"
-        if platform.system() == "Windows":
+        if host.os == "Windows":
             # On Windows, convert the path to a form that Docker can understand.
             d = HOSTSRCDIR.drive
             p = HOSTSRCDIR.as_posix().lstrip(d)
@@ -184,7 +207,7 @@ def main(args):
             : IMAGENAME.index(":")
         ]  # remove the shortest substr from back
         imagename = imagename[
-            : imagename.rfind("/")
+            (imagename.rfind("/") + 1) :
         ]  # remove namespace, keeping the last word only
         PROJ = ""
 
@@ -192,11 +215,14 @@ def main(args):
     # ${IMAGENAME}=[namespace.../]${imagename}:${imageversion}
     # `$imagename` contains neither namespace nor tag.
 
-    DATAVOLUME = "docker-data-volume"
     MOUNTPOINT = "{}/mnt".format(DOCKERHOMEDIR)
-    opts.extend(["--mount", "source={},target={}".format(DATAVOLUME, MOUNTPOINT)])
+    settings = resolve_profile(kwargs["profile"])
+    profile = profile_options(settings, opts, mountpoint=MOUNTPOINT)
+    given_opts = list(opts)
+    opts.extend(profile["data_volume"])
+    opts.extend(profile["mounts"])
 
-    if not args and command in (
+    interactive = not args and command in (
         "/bin/bash",
         "/bin/sh",
         "/usr/bin/bash",
@@ -207,26 +233,32 @@ def main(args):
         "ptpython",
         "ptipython",
         "ipython",
-    ):
+    )
+    if interactive and not warm:
         opts.append("-it")
 
-    if not any(v.startswith("--name=") for v in opts):
+    if not warm and not any(v.startswith("--name=") for v in opts):
         # User did not specify a name for the container.
         name = "{}-{}-utc".format(
             host_user, datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
         )
         opts.append("--name={}".format(name))
 
-    if not any(v.startswith("--shm-size=") for v in opts):
-        # User did not specify shared memory size.
-        opts.append("--shm-size=2gb")
+    # Unless the user specified them.
+    opts.extend(profile["shm"])
+    opts.extend(profile["resources"])
+    profiled = len(opts)
 
-    if not any(v.startswith("--restart=") for v in opts) and "-d" not in opts:
+    if (
+        not warm
+        and not any(v.startswith("--restart=") for v in opts)
+        and "-d" not in opts
+    ):
         opts.append("--rm")
         # User did not specify '--restart=' or '-d'
 
     if gpu_devices is not None:
-        if subprocess.run(["which", "nvidia-smi"]).returncode == 0:
+        if run(["which", "nvidia-smi"]).returncode == 0:
             opts.extend(
                 [
                     "--runtime=nvidia",
@@ -240,11 +272,11 @@ def main(args):
     opts.extend(
         [
             "-e",
-            "HOST_OS=" + host_os,
+            "HOST_OS=" + host.os,
             "-e",
             "HOST_USER=" + host_user,
             "-e",
-            "HOST_IP=" + host_ip,
+            "HOST_IP=" + host.ip,
         ]
     )
 
@@ -278,10 +310,41 @@ def main(args):
             "IMAGE_NAME=" + imagename,
             "-e",
             "IMAGE_VERSION=" + imageversion,
-            "-e",
-            "TZ=America/Los_Angeles",
+            *profile["tz"],
             "--init",
         ]
     )
 
+    if kwargs["dry_run"]:
+        print(shlex.join(["docker", "run"] + opts + [IMAGENAME, command] + args))
+        return
+
+    # `_volumes` and `_warm` are imported only when used, for a fast start.
+    if profile["caches"]:
+        from ._volumes import init_volumes, start_trim
+
+        init_volumes(profile["caches"], IMAGENAME)
+        start_trim(profile["caches"], IMAGENAME)
+
+    if warm:
+        from ._warm import DEFAULT_IDLE_TIMEOUT, run_warm
+
+        run_warm(
+            PROJ or imagename,
+            IMAGENAME,
+            opts,
+            command,
+            args,
+            interactive=interactive,
+            idle_timeout=(
+                DEFAULT_IDLE_TIMEOUT
+                if kwargs["warm_idle"] is None
+                else kwargs["warm_idle"]
+            ),
+            # The options from the profile depend on the host's state, e.g. the
+            # NUMA node with most free memory, so the profile settings stand in.
+            identity=[given_opts, settings, opts[profiled:]],
+        )
+        return
+
     run_command(["docker", "run"] + opts + [IMAGENAME, command] + args)
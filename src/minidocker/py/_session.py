@@ -0,0 +1,157 @@
+import subprocess
+import sys
+import tarfile
+import time
+from contextlib import contextmanager
+
+from .._trace import Popen, run, span
+from .._util import run_command, run_command_for_output
+from ._context import copy_into_container
+
+
+class ContainerSession:
+    """A long-lived container that commands are run in with `docker exec`.
+
+    Use as a context manager; the container is removed on exit.
+    """
+
+    def __init__(self, image, opts=(), name=None):
+        self.image = image
+        self.opts = list(opts)
+        self.name = name
+        self.id = None
+
+    def __enter__(self):
+        if self.name:
+            run(["docker", "rm", "-f", self.name], capture_output=True)
+        self.id = run_command_for_output(
+            [
+                "docker",
+                "run",
+                "--detach",
+                "--init",
+                *(["--name", self.name] if self.name else []),
+                *self.opts,
+                self.image,
+                "sleep",
+                "infinity",
+            ]
+        )
+        return self
+
+    def __exit__(self, *exc):
+        run(["docker", "rm", "--force", self.id], capture_output=True)
+
+    def exec(self, args, *, user=None, workdir=None, capture=False):
+        """Run `args` in the container; return the `CompletedProcess` without
+        checking the exit code. If `capture`, stdout and stderr are captured
+        together as text."""
+        return run(
+            [
+                "docker",
+                "exec",
+                *(["--user", user] if user else []),
+                *(["--workdir", workdir] if workdir else []),
+                self.id,
+                *args,
+            ],
+            **(
+                {"stdout": subprocess.PIPE, "stderr": subprocess.STDOUT, "text": True}
+                if capture
+                else {}
+            ),
+        )
+
+    def put_files(self, dest, files, *, owner=None, clean=False):
+        """Copy `files` (paths relative to the current directory) into directory
+        `dest`. If `clean`, the existing content of `dest` is removed first.
+        `owner` ("user:group") is applied to everything under `dest` afterwards,
+        since `docker cp` creates files as root."""
+        if clean:
+            run_command(
+                [
+                    "docker",
+                    "exec",
+                    "--user",
+                    "root",
+                    self.id,
+                    "find",
+                    dest,
+                    "-mindepth",
+                    "1",
+                    "-delete",
+                ]
+            )
+        copy_into_container(self.id, dest, files)
+        if owner:
+            run_command(
+                [
+                    "docker",
+                    "exec",
+                    "--user",
+                    "root",
+                    self.id,
+                    "chown",
+                    "-R",
+                    owner,
+                    dest,
+                ]
+            )
+
+    def get_dir(self, path, local_dir):
+        """Extract the content of directory `path` into `local_dir`,
+        streamed as a tar archive from `tar` in the container.
+
+        Only regular files and directories inside `local_dir` are extracted;
+        links, devices, and absolute or ".." paths are skipped.
+        """
+        args = ["docker", "exec", self.id, "tar", "-C", path, "-cf", "-", "."]
+        proc = Popen(args, stdout=subprocess.PIPE)
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+            for member in tar:
+                if (
+                    not (member.isfile() or member.isdir())
+                    or member.name.startswith("/")
+                    or ".." in member.name.split("/")
+                ):
+                    print(
+                        "Skipped {} from {}".format(member.name, path), file=sys.stderr
+                    )
+                    continue
+                if hasattr(tarfile, "data_filter"):
+                    # Python 3.12, and security releases of 3.8 to 3.11.
+                    tar.extract(member, local_dir, filter="data")
+                else:
+                    tar.extract(member, local_dir)
+        if proc.wait():
+            raise subprocess.CalledProcessError(proc.returncode, args)
+
+
+class StepTimer:
+    """Records the duration and outcome of named steps, for a summary at the end."""
+
+    def __init__(self):
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        t0 = time.perf_counter()
+        status = "failed"
+        try:
+            with span(name):
+                yield
+            status = "ok"
+        finally:
+            self.steps.append((name, time.perf_counter() - t0, status))
+
+    def add(self, name, seconds, status):
+        self.steps.append((name, seconds, status))
+
+    def summary(self, title="step"):
+        if not self.steps:
+            return ""
+        width = max(len(name) for name, _, _ in self.steps + [(title, 0, 0)])
+        lines = ["{:<{}}  {:>9}  {}".format(title, width, "seconds", "status")]
+        for name, seconds, status in self.steps:
+            lines.append("{:<{}}  {:>9.1f}  {}".format(name, width, seconds, status))
+        return "\n".join(lines)
@@ -0,0 +1,110 @@
+"""
+Cache of passing test runs of ``minidocker.py build``.
+
+A pass of the pre-commit hook and the tests is recorded under a key made of the
+git tree of the commit, the ID of the dev image, and what else goes into the
+run: the options for the test containers, the hook script, with the scripts it
+downloads, and the version of minidocker. A build that would repeat a recorded pass, e.g. a CI job retried
+after an infrastructure failure, skips both steps.
+
+Only runs on a clean working tree are cached, since the tree is taken from the
+commit. The store keeps the ``MAX_ENTRIES`` most recently used records.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import re
+import time
+
+from .. import __version__
+from .._http import session
+from .._util import get_cache_dir, run_command_for_output
+
+
+MAX_ENTRIES = int(os.environ.get("MINIDOCKER_TEST_CACHE_SIZE", "1000"))
+
+HOOK = ".githooks/pre-commit"
+
+_URL_RE = re.compile(r"""https?://[^\s'"()<>]+""")
+
+
+def _dir():
+    return get_cache_dir("test-results")
+
+
+def _hook_hash(path):
+    # The hook that `minidocker.py build` installs is a wrapper that downloads
+    # and runs the current hook, so what it downloads is hashed too.
+    # Raise `OSError` if a download fails.
+    try:
+        with open(path, "rb") as file:
+            script = file.read()
+    except FileNotFoundError:
+        return None
+    h = hashlib.sha256(script)
+    for url in _URL_RE.findall(script.decode(errors="replace")):
+        try:
+            resp = session.get(url, timeout=30)
+        except http.client.HTTPException as e:
+            raise OSError(e) from e
+        if resp.status != 200:
+            raise OSError("GET {} returned {}".format(url, resp.status))
+        h.update(resp.body)
+    return h.hexdigest()
+
+
+def pass_key(*, image_id, opts):
+    """The key of a test run in the current working tree on image `image_id`
+    with `docker` options `opts`; `None` if the tree has uncommitted changes,
+    including untracked files, or the hook could not be fetched."""
+    if run_command_for_output(["git", "status", "--porcelain"]):
+        return None
+    try:
+        hook = _hook_hash(HOOK)
+    except OSError:
+        return None
+    z = {
+        "tree": run_command_for_output(["git", "rev-parse", "HEAD^{tree}"]),
+        "image": image_id,
+        "opts": list(opts),
+        "hook": hook,
+        "minidocker": __version__,
+    }
+    return hashlib.sha256(json.dumps(z, sort_keys=True).encode()).hexdigest()
+
+
+def lookup_pass(key):
+    """The record of a pass under `key`, or `None`. A hit counts as a use."""
+    path = os.path.join(_dir(), key + ".json")
+    try:
+        with open(path) as file:
+            record = json.load(file)
+    except (OSError, ValueError):
+        return None
+    os.utime(path)
+    return record
+
+
+def record_pass(key, **info):
+    """Record a pass under `key` with `info`, e.g. the project and commit,
+    and drop the least recently used records beyond `MAX_ENTRIES`."""
+    path = os.path.join(_dir(), key + ".json")
+    with open(path + ".tmp", "w") as file:
+        json.dump(dict(info, time=time.time()), file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    entries = []
+    with os.scandir(_dir()) as it:
+        for entry in it:
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+    entries.sort(reverse=True)
+    for _, p in entries[MAX_ENTRIES:]:
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
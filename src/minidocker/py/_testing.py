@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .._trace import run
+from .._util import get_cache_dir, run_command, run_command_for_output
+from ._context import copy_into_container, copy_source, prune_command
+
+
+JUNIT_XML = "/tmp/minidocker-junit.xml"
+COVERAGE_FILE = "/tmp/minidocker-coverage"
+# Where each shard container writes its results.
+
+
+def find_test_files(testdir="tests"):
+    return sorted(
+        str(p)
+        for p in Path(testdir).rglob("*.py")
+        if p.name.startswith("test_") or p.name.endswith("_test.py")
+    )
+
+
+def _durations_path(proj):
+    return os.path.join(get_cache_dir("tests", proj), "durations.json")
+
+
+def load_durations(proj):
+    try:
+        with open(_durations_path(proj)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_durations(proj, durations):
+    path = _durations_path(proj)
+    with open(path + ".tmp", "w") as file:
+        json.dump(durations, file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def make_shards(files, n, durations):
+    """Split `files` into at most `n` shards of about equal total duration.
+
+    Files without a recorded duration are assumed to take the average time
+    of those with one. Largest first, each file goes to the currently
+    lightest shard.
+    """
+    known = [durations[f] for f in files if f in durations]
+    default = sum(known) / len(known) if known else 1.0
+    cost = {f: durations.get(f, default) for f in files}
+    shards = [[] for _ in range(min(n, len(files)))]
+    loads = [0.0] * len(shards)
+    for f in sorted(files, key=lambda f: -cost[f]):
+        i = loads.index(min(loads))
+        shards[i].append(f)
+        loads[i] += cost[f]
+    return shards
+
+
+def parse_junit_durations(path):
+    # Total time per test file, from a JUnit XML report of family "xunit1".
+    z = {}
+    for case in ET.parse(path).iter("testcase"):
+        f = case.get("file")
+        if f:
+            z[f] = z.get(f, 0.0) + float(case.get("time") or 0)
+    return z
+
+
+def coverage_map(path, srcdir):
+    """Test file -> set of source files its tests executed, from coverage data
+    file `path` recorded with `--cov-context=test`. Paths under `srcdir` are
+    made relative to it.
+
+    Code run outside of tests, e.g. at import during collection, is not
+    attributed to any test.
+    """
+    z = {}
+    con = sqlite3.connect(path)
+    try:
+        tables = {
+            r[0]
+            for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        rows = []
+        for table in ("line_bits", "arc"):
+            if table in tables:
+                rows += con.execute(
+                    "SELECT DISTINCT file.path, context.context FROM {0} "
+                    "JOIN file ON file.id = {0}.file_id "
+                    "JOIN context ON context.id = {0}.context_id".format(table)
+                ).fetchall()
+    finally:
+        con.close()
+    for source, context in rows:
+        # pytest-cov names contexts like "tests/test_a.py::TestX::test_y|run".
+        test = context.partition("::")[0]
+        if not test or "|" in test:
+            continue
+        if os.path.isabs(source) and source.startswith(srcdir.rstrip("/") + "/"):
+            source = os.path.relpath(source, srcdir)
+        z.setdefault(test, set()).add(source)
+    return z
+
+
+def _run_shard(k, create_args, files, srcdir, refresh_source, outdir):
+    cid = run_command_for_output(
+        [
+            "docker",
+            "create",
+            "-e",
+            "COVERAGE_FILE=" + COVERAGE_FILE,
+            *create_args,
+            "-o",
+            "junit_family=xunit1",
+            "--junitxml=" + JUNIT_XML,
+            "--cov-report=",
+            *files,
+        ]
+    )
+    try:
+        if refresh_source:
+            copy_source(cid, srcdir)
+        t0 = time.perf_counter()
+        proc = run(
+            ["docker", "start", "--attach", cid],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        seconds = time.perf_counter() - t0
+        for path, name in ((JUNIT_XML, "junit"), (COVERAGE_FILE, "coverage")):
+            run(
+                [
+                    "docker",
+                    "cp",
+                    "{}:{}".format(cid, path),
+                    os.path.join(outdir, "{}.{}".format(name, k)),
+                ],
+                capture_output=True,
+            )
+    finally:
+        run(["docker", "rm", cid], capture_output=True)
+    return proc, seconds
+
+
+def run_tests_sharded(
+    *,
+    proj,
+    image,
+    opts,
+    pytest_args,
+    srcdir,
+    workers,
+    refresh_source=False,
+    files=None,
+    contexts=False,
+):
+    """Run the test suite in `workers` containers in parallel and combine coverage.
+
+    `opts` are `docker create` options; `pytest_args` start with the test command,
+    e.g. `["py.test", "--cov=mypkg"]`, and are followed by the shard's test files.
+    Test files are balanced across shards by the durations recorded in earlier runs;
+    the durations are updated from this run.
+
+    `files` are the test files to run, by default all. If `contexts`, coverage
+    is recorded per test, and the `coverage_map` of the run is returned.
+    """
+    if files is None:
+        files = find_test_files()
+    if not files:
+        raise FileNotFoundError("no test files found under `tests/`")
+    if contexts:
+        pytest_args = [*pytest_args, "--cov-context=test"]
+    durations = load_durations(proj)
+    shards = make_shards(files, workers, durations)
+    print(
+        "Running {} test files in {} shards".format(len(files), len(shards)),
+        flush=True,
+    )
+
+    # Files deleted since the image was built are removed before the tests.
+    prune = prune_command(srcdir) if refresh_source else []
+    with tempfile.TemporaryDirectory() as outdir:
+        with ThreadPoolExecutor(len(shards)) as pool:
+            results = list(
+                pool.map(
+                    lambda k: _run_shard(
+                        k,
+                        [*opts, image, *prune, *pytest_args],
+                        shards[k],
+                        srcdir,
+                        refresh_source,
+                        outdir,
+                    ),
+                    range(len(shards)),
+                )
+            )
+
+        failed = []
+        for k, (proc, seconds) in enumerate(results):
+            print(
+                "==== shard {}: {} files, {:.1f}s, exit code {} ====".format(
+                    k, len(shards[k]), seconds, proc.returncode
+                )
+            )
+            print(proc.stdout, flush=True)
+            if proc.returncode:
+                failed.append(k)
+            junit = os.path.join(outdir, "junit.{}".format(k))
+            if os.path.isfile(junit):
+                durations.update(parse_junit_durations(junit))
+        save_durations(proj, durations)
+
+        test_map = {}
+        if contexts and not failed:
+            for k in range(len(shards)):
+                path = os.path.join(outdir, "coverage.{}".format(k))
+                if os.path.isfile(path):
+                    for test, sources in coverage_map(path, srcdir).items():
+                        test_map.setdefault(test, set()).update(sources)
+
+        # Combine the coverage data of all shards into one report.
+        covfiles = sorted(f for f in os.listdir(outdir) if f.startswith("coverage."))
+        if covfiles:
+            cid = run_command_for_output(
+                [
+                    "docker",
+                    "create",
+                    *opts,
+                    image,
+                    *prune,
+                    "bash",
+                    "-c",
+                    "coverage combine /tmp/minidocker-cov/* && coverage report",
+                ]
+            )
+            try:
+                if refresh_source:
+                    copy_source(cid, srcdir)
+                # `coverage combine` runs as docker-user and deletes its inputs,
+                # so their directory must be writable by it; one that
+                # `docker cp` makes on its own is owned by root.
+                extra = {"minidocker-cov": None}
+                for f in covfiles:
+                    with open(os.path.join(outdir, f), "rb") as file:
+                        extra["minidocker-cov/" + f] = file.read()
+                copy_into_container(cid, "/tmp", [], extra)
+                run_command(["docker", "start", "--attach", cid])
+            finally:
+                run(["docker", "rm", cid], capture_output=True)
+
+    if failed:
+        raise subprocess.CalledProcessError(
+            1, "tests in shard(s) {}".format(", ".join(map(str, failed)))
+        )
+    return test_map if contexts else None
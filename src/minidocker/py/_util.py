@@ -2,6 +2,9 @@ try:
     import tomllib as toml
 except ImportError:
     import toml
+import os
+import re
+from functools import lru_cache
 from pathlib import Path
 
 
@@ -16,10 +19,47 @@ def get_package_name():
     and the dash is replaced by underscore in the import name of the package. Specifically,
     the import name of the package is the name of the sole child directory of `src/`.
     """
-    subs = [p for p in Path("src/").iterdir() if p.is_dir()]
+    return _get_package_name(os.getcwd())
+
+
+@lru_cache(maxsize=None)
+def _get_package_name(root):
+    # Memoized per directory.
+    subs = [p for p in Path(root, "src").iterdir() if p.is_dir()]
     assert len(subs) == 1
     return subs[0].name
 
 
 def parse_pyproject():
-    return toml.load(open("pyproject.toml", "rb"))
+    return _parse_pyproject(os.getcwd())
+
+
+@lru_cache(maxsize=None)
+def _parse_pyproject(root):
+    # Memoized per directory; callers must not modify the result.
+    with open(os.path.join(root, "pyproject.toml"), "rb") as file:
+        return toml.load(file)
+
+
+def canonical_name(requirement):
+    """The normalized distribution name of a requirement string, per PEP 503."""
+    name = re.match(r"\s*([A-Za-z0-9._-]+)", requirement).group(1)
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def get_requirements(pyproject):
+    """
+    List the required and all optional dependencies declared in `pyproject.toml`,
+    in order, without duplicates and without references to the project itself
+    (as in `myproj[test]`), whose dependencies are included anyway.
+    """
+    pyproj = pyproject["project"]
+    name = canonical_name(pyproj["name"])
+    reqs = list(pyproj.get("dependencies", []))
+    for deps in pyproj.get("optional-dependencies", {}).values():
+        reqs.extend(deps)
+    z = []
+    for req in reqs:
+        if canonical_name(req) != name and req not in z:
+            z.append(req)
+    return z
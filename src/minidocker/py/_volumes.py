@@ -0,0 +1,292 @@
+"""
+Persistent tool caches for containers started by ``minidocker.py run``.
+
+Each tool cache is a named Docker volume, ``minidocker-cache-<name>``, mounted at
+``/var/cache/minidocker/<name>`` in the container, with an environment variable that points
+the tool at it. The volumes are shared by all containers on the host, so pip
+downloads, ruff results, byte-code and model weights outlive ``--rm`` containers.
+
+Docker volumes have no size limit of their own; instead, a volume is trimmed to
+its limit, least recently used entries first, by a throwaway container at most
+once per ``TRIM_INTERVAL``.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from .._trace import run
+from .._util import get_cache_dir, run_command, run_command_for_output
+
+
+CACHE_DIR = "/var/cache/minidocker"
+# Where the tool caches are mounted in the container. Not under the home
+# directory, where Docker would create a root-owned `~/.cache` for the mounts.
+
+TOOL_CACHES = {
+    # name: (environment variable pointing the tool at `CACHE_DIR/<name>`,
+    #        default size limit, depth of the directories deleted as a whole
+    #        in trimming, 0 meaning individual files)
+    "pip": ("PIP_CACHE_DIR", "10g", 0),
+    "ruff": ("RUFF_CACHE_DIR", "1g", 0),
+    # Byte-code of all imported modules, so that the first import in a new
+    # container need not compile. Python checks each file against its source.
+    "pycache": ("PYTHONPYCACHEPREFIX", "2g", 0),
+    # A model is a directory "hub/models--<org>--<name>", whose files link
+    # to each other; it is kept or deleted as a whole.
+    "huggingface": ("HF_HOME", "100g", 2),
+    "torch": ("TORCH_HOME", "50g", 0),
+}
+
+TRIM_INTERVAL = 24 * 3600
+
+TRIM_IMAGE = "python:3.12-slim"
+# Image of the trimming container when not run for a given image.
+
+_TRIM_SCRIPT = """\
+import json, os, shutil, sys
+
+root, limit, depth = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+units = []  # [last used, bytes, path]
+for dirpath, dirnames, filenames in os.walk(root):
+    rel = os.path.relpath(dirpath, root)
+    level = 0 if rel == "." else rel.count(os.sep) + 1
+    for f in filenames:
+        path = os.path.join(dirpath, f)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue
+        used = max(st.st_atime, st.st_mtime)
+        if depth and level >= depth:
+            top = os.path.join(root, *rel.split(os.sep)[:depth])
+            if units and units[-1][2] == top:
+                units[-1][0] = max(units[-1][0], used)
+                units[-1][1] += st.st_size
+                continue
+            units.append([used, st.st_size, top])
+        else:
+            units.append([used, st.st_size, path])
+total = sum(u[1] for u in units)
+size, freed = total, 0
+if limit >= 0:
+    for used, nbytes, path in sorted(units):
+        if size <= limit:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+        size -= nbytes
+        freed += nbytes
+print(json.dumps({"bytes": size, "freed": freed}))
+"""
+
+
+def parse_size(value):
+    """Bytes in a size like "512m", "10g" or "2gb"; a number is taken as bytes."""
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmgt]?)b?", str(value).strip().lower())
+    if m is None:
+        raise ValueError("invalid size {!r}".format(value))
+    return int(float(m.group(1)) * 1024 ** " kmgt".index(m.group(2) or " "))
+
+
+def volume_name(name):
+    return "minidocker-cache-" + name
+
+
+def cache_limits(caches):
+    """Tool cache name -> size limit in bytes, from the `caches` setting of
+    a profile: a list of names, or a table of name to size limit, `true`
+    meaning the default limit."""
+    if isinstance(caches, (list, tuple)):
+        caches = dict.fromkeys(caches, True)
+    z = {}
+    for name, limit in caches.items():
+        if name not in TOOL_CACHES:
+            raise ValueError(
+                "unknown tool cache '{}'; choose from {}".format(
+                    name, ", ".join(TOOL_CACHES)
+                )
+            )
+        if limit is False:
+            continue
+        z[name] = parse_size(TOOL_CACHES[name][1] if limit is True else limit)
+    return z
+
+
+def cache_options(names, opts=()):
+    """`docker run` options that mount the caches `names` and point the tools
+    at them, except for environment variables already set in `opts`."""
+    z = []
+    for name in names:
+        var = TOOL_CACHES[name][0]
+        path = "{}/{}".format(CACHE_DIR, name)
+        z.extend(["--mount", "source={},target={}".format(volume_name(name), path)])
+        if not any(v.startswith(var + "=") for v in opts):
+            z.extend(["-e", "{}={}".format(var, path)])
+    return z
+
+
+def _stamp(name):
+    # Exists once the volume has been set up; its mtime is the last trim.
+    return os.path.join(get_cache_dir("volumes"), volume_name(name))
+
+
+def init_volumes(names, image):
+    """Create the volumes of caches `names` that have not been set up on this host,
+    owned by the container user; a volume Docker creates on first mount is
+    owned by root."""
+    new = [name for name in names if not os.path.exists(_stamp(name))]
+    if not new:
+        return
+    mounts = []
+    for name in new:
+        mounts.extend(
+            ["--mount", "source={},target=/c/{}".format(volume_name(name), name)]
+        )
+    run_command(
+        [
+            "docker",
+            "run",
+            "--rm",
+            "--user=root",
+            *mounts,
+            image,
+            "chown",
+            "docker-user:docker-user",
+            *("/c/" + name for name in new),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    for name in new:
+        with open(_stamp(name), "w"):
+            pass
+
+
+def trim(limits, image=TRIM_IMAGE):
+    """Delete the least recently used entries of each cache in `limits`
+    (name -> bytes; -1 to only measure) beyond its limit.
+    Return name -> {"bytes": size after, "freed": bytes deleted}.
+
+    Tools take a missing file in their cache as a miss, so files are deleted
+    even while containers use the volume; but a cache trimmed by whole
+    directories, which may be in use, is left alone then.
+    """
+    z = {}
+    for name, limit in limits.items():
+        volume = volume_name(name)
+        if (
+            limit >= 0
+            and TOOL_CACHES[name][2]
+            and run_command_for_output(
+                ["docker", "ps", "--quiet", "--filter", "volume=" + volume]
+            )
+        ):
+            z[name] = None
+            continue
+        out = run_command_for_output(
+            [
+                "docker",
+                "run",
+                "--rm",
+                "--user=root",
+                "--mount",
+                "source={},target=/c".format(volume),
+                image,
+                "python",
+                "-c",
+                _TRIM_SCRIPT,
+                "/c",
+                str(limit),
+                str(TOOL_CACHES[name][2]),
+            ]
+        )
+        z[name] = json.loads(out)
+        if limit >= 0 and os.path.exists(_stamp(name)):
+            os.utime(_stamp(name))
+    return z
+
+
+def start_trim(limits, image):
+    """Trim, in a detached process, the caches of `limits` that are due,
+    i.e. last trimmed more than `TRIM_INTERVAL` ago."""
+    now = time.time()
+    due = {}
+    for name, limit in limits.items():
+        try:
+            if now - os.path.getmtime(_stamp(name)) > TRIM_INTERVAL:
+                due[name] = limit
+        except FileNotFoundError:
+            pass
+    if not due:
+        return
+    for name in due:
+        # Not due again while this runs.
+        os.utime(_stamp(name))
+    args = [sys.executable, "-m", "minidocker.py", "cache", "trim", "--image", image]
+    args += ["{}={}".format(name, limit) for name, limit in due.items()]
+    with open(os.path.join(get_cache_dir("volumes"), "trim.log"), "a") as file:
+        subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=file,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+
+def main(args):
+    from ._context import format_size
+
+    parser = argparse.ArgumentParser(
+        prog="minidocker.py cache",
+        description="inspect and trim the tool-cache volumes of `minidocker.py run`",
+    )
+    parser.add_argument("action", choices=["ls", "trim", "rm"])
+    parser.add_argument(
+        "caches",
+        nargs="*",
+        help="cache names, for `trim` optionally as NAME=BYTES to override the "
+        "limit; all set up on this host if none",
+    )
+    parser.add_argument(
+        "--image", default=TRIM_IMAGE, help="image to run `ls`/`trim` in"
+    )
+    args = parser.parse_args(args)
+
+    limits = {}
+    for v in args.caches:
+        name, _, limit = v.partition("=")
+        limits.update(cache_limits({name: limit or True}))
+    if not limits:
+        limits = cache_limits(
+            [name for name in TOOL_CACHES if os.path.exists(_stamp(name))]
+        )
+
+    if args.action == "rm":
+        for name in limits:
+            run(["docker", "volume", "rm", volume_name(name)])
+            try:
+                os.remove(_stamp(name))
+            except FileNotFoundError:
+                pass
+        return
+    if args.action == "ls":
+        limits = dict.fromkeys(limits, -1)
+    for name, z in trim(limits, args.image).items():
+        if z is None:
+            print("{:<12} in use; skipped".format(name), flush=True)
+        elif args.action == "ls":
+            print("{:<12} {:>10}".format(name, format_size(z["bytes"])), flush=True)
+        else:
+            print(
+                "{:<12} {:>10}, freed {}".format(
+                    name, format_size(z["bytes"]), format_size(z["freed"])
+                ),
+                flush=True,
+            )
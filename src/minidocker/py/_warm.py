@@ -0,0 +1,183 @@
+import hashlib
+import http.client
+import json
+import os
+import re
+import subprocess
+import time
+from urllib.parse import quote
+
+from .._docker_api import get_api
+from .._trace import run
+from .._util import get_cache_dir, run_command, run_command_for_output
+
+
+DEFAULT_IDLE_TIMEOUT = 3600
+# Seconds after its last use that a warm container is removed.
+
+WARM_LABEL = "minidocker.warm"
+IMAGE_LABEL = "minidocker.warm.image"
+
+
+def _inspect(kind, name):
+    # Return the `docker inspect` record of a container or image, or `None`
+    # if it does not exist. Use the Engine API socket if available.
+    api = get_api()
+    if api is not None:
+        try:
+            return api.get("/{}s/{}/json".format(kind, name))
+        except http.client.HTTPException:
+            return None
+        except OSError:
+            pass
+    try:
+        z = run_command_for_output(["docker", kind, "inspect", name])
+    except subprocess.CalledProcessError:
+        return None
+    return json.loads(z)[0]
+
+
+def _stamp(name):
+    return os.path.join(get_cache_dir("warm"), name)
+
+
+def touch(name):
+    with open(_stamp(name), "a"):
+        pass
+    os.utime(_stamp(name))
+
+
+def list_warm():
+    """Names of all warm containers, running or not."""
+    api = get_api()
+    if api is not None:
+        try:
+            filters = quote(json.dumps({"label": [WARM_LABEL]}))
+            z = api.get("/containers/json?all=1&filters=" + filters)
+            return [c["Names"][0].lstrip("/") for c in z]
+        except (OSError, http.client.HTTPException):
+            pass
+    return run_command_for_output(
+        [
+            "docker",
+            "ps",
+            "--all",
+            "--filter",
+            "label=" + WARM_LABEL,
+            "--format",
+            "{{.Names}}",
+        ]
+    ).split()
+
+
+def reap_idle(timeout=DEFAULT_IDLE_TIMEOUT, keep=()):
+    """Remove warm containers not used within `timeout` seconds.
+
+    Containers with a command still running in them are kept. Reaping happens
+    only here, i.e. on a later warm run; there is no timer that stops an idle
+    container by itself.
+    """
+    names = list_warm()
+    now = time.time()
+    for name in names:
+        if name in keep:
+            continue
+        try:
+            idle = now - os.path.getmtime(_stamp(name))
+        except OSError:
+            idle = float("inf")
+        if idle > timeout:
+            # Docker lists the exec sessions that have not exited.
+            if (_inspect("container", name) or {}).get("ExecIDs"):
+                continue
+            run(["docker", "rm", "--force", name], capture_output=True)
+            try:
+                os.remove(_stamp(name))
+            except OSError:
+                pass
+
+
+def container_name(key, image, opts):
+    """Name of the warm container for image `image` run with `docker run` options `opts`.
+
+    The options, which include mounts, ports and environment, are part of the name,
+    so a change in any of them leads to a different container. `opts` may be anything
+    that determines the options, such as the settings they are resolved from.
+    """
+    z = json.dumps([image, opts], sort_keys=True)
+    h = hashlib.sha256(z.encode()).hexdigest()[:12]
+    key = re.sub(r"[^a-zA-Z0-9_.-]", "-", key)
+    return "minidocker-warm-{}-{}".format(key, h)
+
+
+def ensure_warm(key, image, opts, identity=None):
+    """Return the name of a running warm container for `image` with `opts`,
+    creating (or recreating, if its image is outdated) as needed.
+    The container is named after `identity`, if given, instead of `opts`."""
+    name = container_name(key, image, opts if identity is None else identity)
+    image_id = (_inspect("image", image) or {}).get("Id")
+    info = _inspect("container", name)
+    if info is not None:
+        if info["State"]["Running"] and info["Image"] == image_id:
+            return name
+        # Stopped, or the image has been rebuilt since.
+        run(["docker", "rm", "--force", name], capture_output=True)
+    run_command(
+        [
+            "docker",
+            "run",
+            "--detach",
+            "--name",
+            name,
+            "--label",
+            WARM_LABEL + "=1",
+            "--label",
+            "{}={}".format(IMAGE_LABEL, image_id),
+            *opts,
+            image,
+            "sleep",
+            "infinity",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    return name
+
+
+def run_warm(
+    key,
+    image,
+    opts,
+    command,
+    args,
+    *,
+    interactive=False,
+    idle_timeout=DEFAULT_IDLE_TIMEOUT,
+    identity=None,
+):
+    """Run `command` with `args` in the warm container for `image` and `opts`
+    via `docker exec`, starting the container if needed.
+
+    The command runs as the container's user in its working directory,
+    with its environment, all of which are set by `opts`. If `opts` vary
+    between equivalent runs, `identity` gives what the container is
+    reused for instead (see `ensure_warm`).
+    """
+    # The container is not removed on exit, and gets its own name.
+    opts = [v for v in opts if v not in ("--rm", "-it") and not v.startswith("--name=")]
+    name = ensure_warm(key, image, opts, identity)
+    touch(name)
+    reap_idle(idle_timeout, keep=(name,))
+    try:
+        run_command(
+            [
+                "docker",
+                "exec",
+                *(["-it"] if interactive else []),
+                name,
+                command,
+                *args,
+            ]
+        )
+    finally:
+        # Idle time counts from the end of the command.
+        touch(name)
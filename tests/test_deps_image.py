@@ -0,0 +1,80 @@
+import subprocess
+import time
+
+import pytest
+
+from minidocker.py import _deps_image
+
+
+DAY = 86400
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    # Shared images "a" to "e", least recently used first, with records of
+    # their use; `fail` holds the tags whose removal fails.
+    now = time.time()
+    z = [
+        {"key": "a", "size": 40, "last_used": now - 5 * DAY, "in_use": True},
+        {"key": "b", "size": 30, "last_used": now - 4 * DAY, "in_use": False},
+        {"key": "c", "size": 20, "last_used": now - 3 * DAY, "in_use": False},
+        {"key": "d", "size": 20, "last_used": now - 2 * DAY, "in_use": False},
+        {"key": "e", "size": 10, "last_used": now, "in_use": False},
+    ]
+    for image in z:
+        image.update(tag="deps:" + image["key"], parent="python:3.11")
+    monkeypatch.setenv("MINIDOCKER_CACHE_DIR", str(tmp_path))
+    for image in z:
+        _deps_image.record_use(image["key"])
+    fail = set()
+    removed = []
+
+    def run(cmd, **kwargs):
+        removed.append(cmd[-1])
+        return subprocess.CompletedProcess(cmd, 1 if cmd[-1] in fail else 0, "", "busy")
+
+    monkeypatch.setattr(_deps_image, "list_images", lambda: z)
+    monkeypatch.setattr(_deps_image, "run", run)
+    return z, fail, removed
+
+
+def keys(images):
+    return [v["key"] for v in images]
+
+
+def test_within_budget_and_age(images):
+    assert _deps_image.gc(budget=120, max_age=10 * DAY) == []
+
+
+def test_over_budget_least_recently_used_first(images):
+    _, _, removed = images
+    # 120 bytes in all; "a" is in use, so "b" and "c" go to get to 70.
+    assert keys(_deps_image.gc(budget=70, max_age=10 * DAY)) == ["b", "c"]
+    assert removed == ["deps:b", "deps:c"]
+    assert not _deps_image.last_used("b")
+    assert _deps_image.last_used("d")
+
+
+def test_too_old(images):
+    # Within the budget, but "b" and "c" are unused for over 2.5 days.
+    assert keys(_deps_image.gc(budget=1000, max_age=2.5 * DAY)) == ["b", "c"]
+
+
+def test_failed_removal_is_kept(images, capsys):
+    _, fail, removed = images
+    fail.add("deps:b")
+    # "b" stays, so its size still counts and "d" and "e" go too.
+    assert keys(_deps_image.gc(budget=70, max_age=10 * DAY)) == ["c", "d", "e"]
+    assert removed == ["deps:b", "deps:c", "deps:d", "deps:e"]
+    assert _deps_image.last_used("b")
+    assert capsys.readouterr().err == 'Could not remove "deps:b": busy\n'
+
+
+def test_dry_run(images):
+    _, _, removed = images
+    assert keys(_deps_image.gc(budget=70, max_age=10 * DAY, dry_run=True)) == [
+        "b",
+        "c",
+    ]
+    assert removed == []
+    assert _deps_image.last_used("b")
@@ -0,0 +1,167 @@
+import sqlite3
+import time
+
+import pytest
+
+from minidocker.py import _impact
+from minidocker.py._testing import coverage_map
+
+
+FILES = ["tests/test_a.py", "tests/test_b.py", "tests/test_c.py"]
+
+
+@pytest.fixture
+def impact(monkeypatch):
+    # A recorded run on commit "abc" and image "img", and the files changed since.
+    data = {
+        "commit": "abc",
+        "image": "img",
+        "runs_since_full": 0,
+        "full_run_time": time.time(),
+        "tests": {
+            "tests/test_a.py": ["src/pkg/a.py"],
+            "tests/test_b.py": ["src/pkg/a.py", "src/pkg/b.py"],
+            "tests/test_c.py": [],
+        },
+    }
+    changed = []
+    monkeypatch.setattr(_impact, "load_impact", lambda proj: data)
+    monkeypatch.setattr(_impact, "changed_files", lambda commit: changed)
+    return data, changed
+
+
+def test_select_by_covered_source(impact):
+    _, changed = impact
+    changed.append("src/pkg/b.py")
+    selected, full, _ = _impact.select_tests("p", FILES, "img")
+    assert selected == ["tests/test_b.py"]
+    assert not full
+
+
+def test_select_changed_and_new_test_files(impact):
+    _, changed = impact
+    changed.append("tests/test_c.py")
+    files = FILES + ["tests/test_new.py"]
+    selected, full, _ = _impact.select_tests("p", files, "img")
+    assert selected == ["tests/test_c.py", "tests/test_new.py"]
+    assert not full
+
+
+def test_select_nothing_changed(impact):
+    _, changed = impact
+    changed.append("README.rst")
+    assert _impact.select_tests("p", FILES, "img")[:2] == ([], False)
+
+
+@pytest.mark.parametrize(
+    "path", ["pyproject.toml", "tests/conftest.py", "src/pkg/data/config.json"]
+)
+def test_full_on_global_change(impact, path):
+    _, changed = impact
+    changed.append(path)
+    selected, full, reason = _impact.select_tests("p", FILES, "img")
+    assert selected == FILES and full
+    assert path in reason
+
+
+def test_full_on_new_image(impact):
+    selected, full, reason = _impact.select_tests("p", FILES, "img2")
+    assert selected == FILES and full
+    assert "image" in reason
+
+
+def test_full_when_due(impact):
+    data, _ = impact
+    data["runs_since_full"] = _impact.FULL_RUN_EVERY
+    assert _impact.select_tests("p", FILES, "img")[1]
+    data["runs_since_full"] = 0
+    data["full_run_time"] = time.time() - _impact.FULL_RUN_AGE - 1
+    assert _impact.select_tests("p", FILES, "img")[1]
+
+
+def test_full_without_record_or_commit(monkeypatch, impact):
+    monkeypatch.setattr(_impact, "changed_files", lambda commit: None)
+    assert _impact.select_tests("p", FILES, "img")[1]
+    monkeypatch.setattr(_impact, "load_impact", lambda proj: None)
+    assert _impact.select_tests("p", FILES, "img")[1]
+    assert _impact.select_tests("p", FILES, "img", full=True)[1]
+
+
+def test_forces_full():
+    assert _impact._forces_full("setup.cfg")
+    assert _impact._forces_full("tests/sub/conftest.py")
+    assert _impact._forces_full("src/pkg/templates/x.html")
+    assert not _impact._forces_full("src/pkg/x.py")
+    assert not _impact._forces_full("docs/index.rst")
+
+
+def test_record_impact(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MINIDOCKER_CACHE_DIR", str(tmp_path / "cache"))
+    (tmp_path / "tests").mkdir()
+    for f in FILES:
+        (tmp_path / f).write_text("")
+    git = {"status": "", "rev-parse": "c1"}
+    monkeypatch.setattr(_impact, "run_command_for_output", lambda args: git[args[1]])
+
+    _impact.record_impact(
+        "p", FILES, {"tests/test_a.py": {"src/pkg/a.py"}}, True, "img"
+    )
+    data = _impact.load_impact("p")
+    assert data["commit"] == "c1" and data["image"] == "img"
+    assert data["runs_since_full"] == 0
+    assert data["tests"] == {
+        "tests/test_a.py": ["src/pkg/a.py"],
+        "tests/test_b.py": [],
+        "tests/test_c.py": [],
+    }
+
+    # An incremental run updates the tests it ran; deleted test files are dropped.
+    (tmp_path / "tests/test_c.py").unlink()
+    git["rev-parse"] = "c2"
+    _impact.record_impact(
+        "p", ["tests/test_b.py"], {"tests/test_b.py": {"src/pkg/b.py"}}, False, "img"
+    )
+    data = _impact.load_impact("p")
+    assert data["commit"] == "c2" and data["runs_since_full"] == 1
+    assert data["tests"] == {
+        "tests/test_a.py": ["src/pkg/a.py"],
+        "tests/test_b.py": ["src/pkg/b.py"],
+    }
+
+    # Not recorded from a dirty tree.
+    git["status"] = " M src/pkg/a.py"
+    git["rev-parse"] = "c3"
+    _impact.record_impact("p", FILES, {}, True, "img")
+    assert _impact.load_impact("p")["commit"] == "c2"
+
+
+def test_coverage_map(tmp_path):
+    # The tables of coverage's SQLite data file that `coverage_map` reads.
+    path = str(tmp_path / "coverage")
+    con = sqlite3.connect(path)
+    con.executescript(
+        """
+        CREATE TABLE file (id INTEGER PRIMARY KEY, path TEXT);
+        CREATE TABLE context (id INTEGER PRIMARY KEY, context TEXT);
+        CREATE TABLE line_bits (file_id INTEGER, context_id INTEGER, numbits BLOB);
+        CREATE TABLE arc (file_id INTEGER, context_id INTEGER, fromno INTEGER,
+                          tono INTEGER);
+        INSERT INTO file VALUES
+            (1, '/tmp/src/src/pkg/a.py'), (2, '/tmp/src/src/pkg/b.py'),
+            (3, '/elsewhere/c.py');
+        INSERT INTO context VALUES
+            (1, ''),
+            (2, 'tests/test_a.py::test_x|run'),
+            (3, 'tests/test_a.py::TestY::test_z|setup'),
+            (4, 'tests/test_b.py::test_w[1-2]|run');
+        INSERT INTO line_bits VALUES (1, 1, x'01'), (1, 2, x'01'), (2, 3, x'01');
+        INSERT INTO arc VALUES (3, 4, 1, 2);
+        """
+    )
+    con.commit()
+    con.close()
+    assert coverage_map(path, "/tmp/src") == {
+        "tests/test_a.py": {"src/pkg/a.py", "src/pkg/b.py"},
+        "tests/test_b.py": {"/elsewhere/c.py"},
+    }
@@ -0,0 +1,66 @@
+import pytest
+
+from minidocker.py._profiles import PROFILES, load_profiles, resolve_profile
+
+
+@pytest.fixture
+def profiles_file(tmp_path, monkeypatch):
+    # Writes the profiles file named by `$MINIDOCKER_PROFILES`.
+    path = tmp_path / "profiles.toml"
+    monkeypatch.setenv("MINIDOCKER_PROFILES", str(path))
+    return lambda text: path.write_text(text)
+
+
+def test_builtin_profiles(profiles_file):
+    assert load_profiles() == PROFILES
+    torch = resolve_profile("torch")
+    assert torch["shm"] == "25%"
+    # From "default".
+    assert torch["data_volume"] == "docker-data-volume"
+    assert "extends" not in torch
+
+
+def test_file_overrides_and_extends(profiles_file):
+    profiles_file(
+        "[torch]\n"
+        'shm = "4gb"\n'
+        "ulimits = {nofile = 1024}\n"
+        "[big]\n"
+        'extends = "torch"\n'
+        "cpus = 16\n"
+        "ulimits = {stack = 67108864}\n"
+        "[mine]\n"
+        'tz = ""\n'
+    )
+    profiles = load_profiles()
+    # Merged over the built-in profile of the same name.
+    assert profiles["torch"]["cpuset"] == "numa"
+    assert profiles["torch"]["shm"] == "4gb"
+    assert profiles["mine"]["extends"] == "default"
+
+    big = resolve_profile("big", profiles)
+    assert big["shm"] == "4gb"
+    assert big["cpus"] == 16
+    # The built-in `ulimits` of "torch" are replaced by the file; those of
+    # the profiles in the chain are merged.
+    assert big["ulimits"] == {"nofile": 1024, "stack": 67108864}
+    mine = resolve_profile("mine", profiles)
+    assert mine["tz"] == ""
+    assert mine["shm"] == PROFILES["default"]["shm"]
+
+
+def test_unknown_key(profiles_file):
+    profiles_file("[x]\nshm_size = 1\n")
+    with pytest.raises(ValueError, match="unknown key.*shm_size.*profile 'x'"):
+        load_profiles()
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError, match="unknown profile 'nope'; choose from"):
+        resolve_profile("nope", PROFILES)
+
+
+def test_cyclic_profiles():
+    profiles = {"a": {"extends": "b"}, "b": {"extends": "a"}}
+    with pytest.raises(ValueError, match="cyclic profiles: a -> b -> a"):
+        resolve_profile("a", profiles)
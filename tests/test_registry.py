@@ -0,0 +1,168 @@
+import base64
+import http.server
+import json
+import os
+import stat
+import threading
+
+import pytest
+
+from minidocker import _registry
+from minidocker._http import HTTPClient
+
+
+HUB = "https://registry-1.docker.io"
+
+
+@pytest.fixture
+def docker_config(tmp_path, monkeypatch):
+    # Writes `config.json` under `$DOCKER_CONFIG`.
+    monkeypatch.setenv("DOCKER_CONFIG", str(tmp_path))
+    _registry.docker_credentials.cache_clear()
+    yield lambda config: (tmp_path / "config.json").write_text(json.dumps(config))
+    _registry.docker_credentials.cache_clear()
+
+
+def _auth(user, secret):
+    return base64.b64encode("{}:{}".format(user, secret).encode()).decode()
+
+
+def test_credentials_from_auths(docker_config):
+    docker_config(
+        {
+            "auths": {
+                "https://index.docker.io/v1/": {"auth": _auth("me", "pw")},
+                "ghcr.io": {"auth": _auth("gh", "tok")},
+            }
+        }
+    )
+    assert _registry.docker_credentials(HUB) == ("me", "pw")
+    assert _registry.docker_credentials("https://ghcr.io") == ("gh", "tok")
+    assert _registry.docker_credentials("https://quay.io") is None
+
+
+def test_credentials_from_helper(docker_config, tmp_path, monkeypatch):
+    helper = tmp_path / "docker-credential-fake"
+    helper.write_text(
+        "#!/bin/sh\n"
+        'read server\necho "{\\"Username\\": \\"u\\", \\"Secret\\": \\"$server\\"}"\n'
+    )
+    helper.chmod(helper.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv(
+        "PATH", "{}{}{}".format(tmp_path, os.pathsep, os.environ["PATH"])
+    )
+    docker_config({"credHelpers": {"ghcr.io": "fake"}, "credsStore": "fake"})
+    assert _registry.docker_credentials("https://ghcr.io") == ("u", "ghcr.io")
+    assert _registry.docker_credentials(HUB) == ("u", "https://index.docker.io/v1/")
+
+
+def test_no_credentials(docker_config):
+    # Identity tokens are not supported; a missing helper gives nothing.
+    docker_config(
+        {
+            "auths": {"https://index.docker.io/v1/": {"auth": _auth("<token>", "x")}},
+            "credHelpers": {"ghcr.io": "missing"},
+        }
+    )
+    assert _registry.docker_credentials(HUB) is None
+    assert _registry.docker_credentials("https://ghcr.io") is None
+
+
+class _Server:
+    # Records the `Authorization` header of each request; "/redirect?to=URL"
+    # answers with a redirect to URL.
+
+    def __init__(self):
+        self.auth = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.auth.append(self.headers.get("Authorization"))
+                if self.path.startswith("/redirect?to="):
+                    self.send_response(307)
+                    self.send_header("Location", self.path[len("/redirect?to=") :])
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self._httpd.server_port)
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def test_redirect_drops_authorization_across_hosts():
+    client = HTTPClient()
+    with _Server() as a, _Server() as b:
+        headers = {"Authorization": "Bearer t"}
+        client.get("{}/redirect?to={}/x".format(a.url, a.url), headers)
+        client.get("{}/redirect?to={}/blob".format(a.url, b.url), headers)
+    client.close()
+    assert a.auth == ["Bearer t", "Bearer t", "Bearer t"]
+    assert b.auth == [None]
+
+
+def test_token_request_sends_credentials(monkeypatch):
+    class Session:
+        def get(self, url, headers=None, timeout=None):
+            calls.append((url, headers))
+            return type("R", (), {"status": 200, "json": lambda self: {"token": "t"}})()
+
+    calls = []
+    monkeypatch.setattr(_registry, "session", Session())
+    monkeypatch.setattr(_registry, "docker_credentials", lambda url: ("me", "pw"))
+    client = _registry.RegistryClient(HUB)
+    assert client._token("https://auth.docker.io/token", "hub", "s") == "t"
+    # Not over plain HTTP.
+    client._token("http://insecure/token", "hub", "s")
+    assert calls[0][1] == {"Authorization": "Basic " + _auth("me", "pw")}
+    assert calls[1][1] == {}
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("debian", (HUB, "library/debian", None)),
+        ("python:3.11", (HUB, "library/python", "3.11")),
+        ("zppz/py3:24.01.01", (HUB, "zppz/py3", "24.01.01")),
+        ("ghcr.io/org/img", ("https://ghcr.io", "org/img", None)),
+        ("ghcr.io/org/img:v1", ("https://ghcr.io", "org/img", "v1")),
+        ("registry:5000/img:v1", ("https://registry:5000", "img", "v1")),
+        ("localhost:5000/x/y:v1", ("http://localhost:5000", "x/y", "v1")),
+        ("127.0.0.1:5000/y", ("http://127.0.0.1:5000", "y", None)),
+        ("localhost/y", ("http://localhost", "y", None)),
+        ("debian@sha256:ab", (HUB, "library/debian", "sha256:ab")),
+        # The digest wins over the tag.
+        (
+            "localhost:5000/x/y:v1@sha256:ab",
+            ("http://localhost:5000", "x/y", "sha256:ab"),
+        ),
+    ],
+)
+def test_parse_reference(name, expected):
+    assert _registry.parse_reference(name) == expected
+
+
+def test_parse_reference_hub_registry():
+    mirror = "https://mirror.example/"
+    assert _registry.parse_reference("debian:12", mirror) == (
+        "https://mirror.example",
+        "library/debian",
+        "12",
+    )
+    # Other registries are not affected.
+    assert _registry.parse_reference("ghcr.io/o/i", mirror)[0] == "https://ghcr.io"
@@ -0,0 +1,37 @@
+from minidocker.py import _test_cache
+
+
+class _Response:
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+
+def test_hook_hash_covers_downloaded_hook(tmp_path, monkeypatch):
+    hook = tmp_path / "pre-commit"
+    hook.write_text("bash <(curl -s https://example.com/hooks/pre-commit) $@\n")
+    remote = {"body": b"ruff check"}
+    monkeypatch.setattr(
+        _test_cache.session,
+        "get",
+        lambda url, timeout=None: _Response(
+            200 if url == "https://example.com/hooks/pre-commit" else 404,
+            remote["body"],
+        ),
+    )
+    h = _test_cache._hook_hash(str(hook))
+    assert h == _test_cache._hook_hash(str(hook))
+    remote["body"] = b"ruff check && mypy"
+    assert _test_cache._hook_hash(str(hook)) != h
+    assert _test_cache._hook_hash(str(tmp_path / "missing")) is None
+
+
+def test_no_key_if_hook_download_fails(tmp_path, monkeypatch):
+    hook = tmp_path / "pre-commit"
+    hook.write_text("bash <(curl -s https://example.com/gone)\n")
+    monkeypatch.setattr(_test_cache, "HOOK", str(hook))
+    monkeypatch.setattr(_test_cache, "run_command_for_output", lambda args: "")
+    monkeypatch.setattr(
+        _test_cache.session, "get", lambda url, timeout=None: _Response(404, b"")
+    )
+    assert _test_cache.pass_key(image_id="img", opts=[]) is None
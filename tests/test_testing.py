@@ -0,0 +1,27 @@
+from minidocker.py._testing import make_shards
+
+
+def test_shards_balanced_by_duration():
+    durations = {"a": 10.0, "b": 6.0, "c": 5.0, "d": 4.0, "e": 1.0}
+    shards = make_shards(list(durations), 2, durations)
+    # Longest first, each to the shard with the least time so far.
+    assert shards == [["a", "d"], ["b", "c", "e"]]
+    assert sorted(sum(durations[f] for f in s) for s in shards) == [12.0, 14.0]
+
+
+def test_unknown_duration_is_the_average():
+    durations = {"a": 4.0, "b": 2.0}
+    shards = make_shards(["a", "b", "new"], 2, durations)
+    # "new" costs 3.0, more than "b", so it goes before it.
+    assert shards == [["a"], ["new", "b"]]
+
+
+def test_no_durations():
+    shards = make_shards(["a", "b", "c", "d"], 2, {})
+    assert sorted(len(s) for s in shards) == [2, 2]
+    assert sorted(sum(shards, [])) == ["a", "b", "c", "d"]
+
+
+def test_more_shards_than_files():
+    assert make_shards(["a", "b"], 4, {}) == [["a"], ["b"]]
+    assert make_shards([], 4, {}) == []
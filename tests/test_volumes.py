@@ -0,0 +1,80 @@
+import pytest
+
+from minidocker._util import host
+from minidocker.py import _volumes
+from minidocker.py._profiles import profile_options
+
+
+def test_parse_size():
+    assert _volumes.parse_size("512m") == 512 << 20
+    assert _volumes.parse_size("2gb") == 2 << 30
+    assert _volumes.parse_size("1.5K") == 1536
+    assert _volumes.parse_size(100) == 100
+    with pytest.raises(ValueError, match="invalid size '2 lbs'"):
+        _volumes.parse_size("2 lbs")
+
+
+def test_cache_limits():
+    assert _volumes.cache_limits(["pip", "ruff"]) == {"pip": 10 << 30, "ruff": 1 << 30}
+    assert _volumes.cache_limits({"pip": "20g", "ruff": False, "torch": True}) == {
+        "pip": 20 << 30,
+        "torch": 50 << 30,
+    }
+    with pytest.raises(ValueError, match="unknown tool cache 'npm'"):
+        _volumes.cache_limits(["npm"])
+
+
+def test_cache_options():
+    assert _volumes.cache_options(["pip", "ruff"], ["RUFF_CACHE_DIR=/x"]) == [
+        "--mount",
+        "source=minidocker-cache-pip,target=/var/cache/minidocker/pip",
+        "-e",
+        "PIP_CACHE_DIR=/var/cache/minidocker/pip",
+        "--mount",
+        "source=minidocker-cache-ruff,target=/var/cache/minidocker/ruff",
+    ]
+
+
+def test_profile_mounts(monkeypatch):
+    monkeypatch.setattr(host, "memory", 16 << 30)
+    profile = {
+        "scratch": "25%",
+        "pytest_cache": "256m",
+        "tmpfs": {"/var/tmp": "1g"},
+        "caches": {"pip": "1g"},
+    }
+    z = profile_options(profile, ["-e", "TMPDIR=/tmp"], mountpoint="/mnt")
+    assert z["mounts"] == [
+        "--mount",
+        "type=tmpfs,destination=/var/tmp,tmpfs-mode=1777,tmpfs-size={}".format(1 << 30),
+        "--mount",
+        "type=tmpfs,destination=/tmp/scratch,tmpfs-mode=1777,tmpfs-size={}".format(
+            4 << 30
+        ),
+        "--mount",
+        "type=tmpfs,destination=/tmp/pytest-cache,tmpfs-mode=1777,tmpfs-size={}".format(
+            256 << 20
+        ),
+        # TMPDIR is set by the user.
+        "-e",
+        "PYTEST_ADDOPTS=-o cache_dir=/tmp/pytest-cache",
+        "--mount",
+        "source=minidocker-cache-pip,target=/var/cache/minidocker/pip",
+        "-e",
+        "PIP_CACHE_DIR=/var/cache/minidocker/pip",
+    ]
+    assert z["caches"] == {"pip": 1 << 30}
+
+
+def test_profile_mounts_unsized(monkeypatch):
+    # A percentage of unknown host memory gives a tmpfs of Docker's default size.
+    monkeypatch.setattr(host, "memory", None)
+    z = profile_options({"scratch": "10%"}, mountpoint="/mnt")
+    assert z["mounts"] == [
+        "--mount",
+        "type=tmpfs,destination=/tmp/scratch,tmpfs-mode=1777",
+        "-e",
+        "TMPDIR=/tmp/scratch",
+    ]
+    assert z["caches"] == {}
+    assert profile_options({}, mountpoint="/mnt")["mounts"] == []